@@ -0,0 +1,8 @@
+from tornado.options import options, define
+
+# defined by the applications using BaseModel
+try:
+    options.mongodb_reconnect_retries
+except AttributeError:
+    define("mongodb_reconnect_retries", default=0, type=int)
+    define("mongodb_reconnect_timeout", default=0, type=int)
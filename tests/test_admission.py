@@ -0,0 +1,84 @@
+import unittest
+
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.httpclient import HTTPError
+from tornado.testing import AsyncHTTPTestCase, AsyncTestCase, gen_test
+from tornado.web import Application
+
+from tornado_rest.base import admission
+from tornado_rest.base.admission import AdmissionGate, Overloaded
+from tornado_rest.base.handlers import BaseHandler
+
+
+class AdmissionGateTest(AsyncTestCase):
+
+    @gen_test
+    def test_slot_is_handed_to_oldest_waiter(self):
+        gate = AdmissionGate("handover", 1, max_queue=2, timeout=30)
+        yield gate.acquire()
+        first, second = gate.acquire(), gate.acquire()
+        self.assertEqual(gate.queue_depth, 2)
+        gate.release()
+        self.assertTrue(first.done())
+        self.assertFalse(second.done())
+        gate.release()
+        yield second
+        gate.release()
+        self.assertEqual(gate.stats()["in_flight"], 0)
+        self.assertEqual(gate.stats()["admitted"], 3)
+
+    @gen_test
+    def test_full_queue_is_shed(self):
+        gate = AdmissionGate("shed", 1, max_queue=0)
+        yield gate.acquire()
+        with self.assertRaises(Overloaded):
+            yield gate.acquire()
+        self.assertEqual(gate.shed, 1)
+        self.assertEqual(gate.timed_out, 0)
+
+
+class GateRegistryTest(unittest.TestCase):
+
+    def test_gates_are_shared_by_name(self):
+        gate = admission.get_gate("test.registry", 3)
+        self.assertIs(admission.get_gate("test.registry", 5), gate)
+        self.assertEqual(
+            admission.stats()["test.registry"]["max_in_flight"], 3)
+
+
+class SlowHandler(BaseHandler):
+    allowed_methods = ["get"]
+    max_in_flight = 1
+    retry_after = 7
+    release = None
+
+    @gen.coroutine
+    def get(self):
+        yield SlowHandler.release
+        self.render({"ok": True})
+
+
+class HandlerAdmissionTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return Application([(r"/", SlowHandler)], db=None)
+
+    @gen_test
+    def test_requests_over_limit_get_503(self):
+        SlowHandler.release = Future()
+        first = self.http_client.fetch(self.get_url("/"))
+        with self.assertRaises(HTTPError) as error:
+            yield self.http_client.fetch(self.get_url("/"))
+        self.assertEqual(error.exception.code, 503)
+        self.assertEqual(
+            error.exception.response.headers["Retry-After"], "7")
+        SlowHandler.release.set_result(None)
+        response = yield first
+        self.assertEqual(response.code, 200)
+        name = "handler.{0}.SlowHandler".format(SlowHandler.__module__)
+        self.assertEqual(admission.stats()[name]["in_flight"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
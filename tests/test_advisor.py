@@ -0,0 +1,102 @@
+import unittest
+
+from schematics.types import IntType, StringType
+from tornado.ioloop import IOLoop
+from tornado.testing import AsyncTestCase, gen_test
+
+from tornado_rest.base.advisor import (IndexAdvisor, plan_problems,
+                                       query_shape, suggest_index)
+from tornado_rest.base.models import BaseModel, GeoPoint
+
+
+class ShopModel(BaseModel):
+    MONGO_COLLECTION = "advisor_shops"
+    MONGO_INDEXES = ["city", {"keys": [("name", 1)], "unique": True}]
+
+    city = StringType()
+    name = StringType()
+    rating = IntType()
+    location = GeoPoint()
+
+
+class FakeCollection(object):
+
+    def __init__(self, explain):
+        self._explain = explain
+        self.indexes = []
+
+    def __getitem__(self, name):
+        return self
+
+    def find(self, query, fields=None):
+        return self
+
+    def sort(self, sort):
+        return self
+
+    def explain(self, callback):
+        IOLoop.current().add_callback(callback, self._explain, None)
+
+    def ensure_index(self, keys, callback, **options):
+        self.indexes.append((keys, options))
+        IOLoop.current().add_callback(callback, "index", None)
+
+
+class QueryShapeTest(unittest.TestCase):
+
+    def test_values_are_ignored(self):
+        self.assertEqual(
+            query_shape({"city": "Oslo", "rating": {"$gte": 3}},
+                        [("name", 1)]),
+            query_shape({"city": "Rome", "rating": {"$gte": 5}},
+                        [("name", 1)]))
+
+    def test_equality_sort_range(self):
+        shape = query_shape({"rating": {"$gte": 3}, "city": "Oslo"},
+                            [("name", -1)])
+        self.assertEqual(suggest_index(shape),
+                         [("city", 1), ("name", -1), ("rating", 1)])
+
+    def test_plan_problems(self):
+        self.assertEqual(
+            plan_problems({"cursor": "BasicCursor", "scanAndOrder": True}),
+            ["collection scan", "in memory sort"])
+        self.assertEqual(
+            plan_problems({"cursor": "BtreeCursor city_1"}), [])
+        self.assertEqual(plan_problems({"queryPlanner": {"winningPlan": {
+            "stage": "SORT", "inputStage": {
+                "stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}}}),
+            ["in memory sort"])
+
+
+class IndexAdvisorTest(AsyncTestCase):
+
+    @gen_test
+    def test_slow_unindexed_queries_are_reported(self):
+        advisor = IndexAdvisor(slow_ms=100)
+        advisor.observe(ShopModel, {"city": "Oslo"}, [], {}, 50)
+        advisor.observe(ShopModel, {"rating": {"$gt": 3}}, [("name", 1)],
+                        {}, 150)
+        advisor.observe(ShopModel, {"rating": {"$gt": 4}}, [("name", 1)],
+                        {}, 250)
+        report = yield advisor.report(
+            FakeCollection({"cursor": "BasicCursor"}))
+        self.assertEqual(len(report), 1)
+        self.assertEqual(report[0]["count"], 2)
+        self.assertEqual(report[0]["avg_ms"], 200)
+        self.assertEqual(report[0]["suggested_index"],
+                         [("name", 1), ("rating", 1)])
+
+    @gen_test
+    def test_declared_indexes_are_ensured(self):
+        db = FakeCollection({})
+        yield ShopModel.ensure_indexes(db)
+        self.assertEqual(db.indexes, [
+            ([("city", 1)], {}),
+            ([("name", 1)], {"unique": True}),
+            ([("location", "2dsphere")], {}),
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import json
+
+from tornado import gen
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+
+from tornado_rest.base.handlers import BaseAggregateHandler, \
+    BaseValuesHandler
+from tornado_rest.base.mixins import FilterMixin
+from tests.test_validation import PlaceModel
+
+
+class CannedPlaceModel(PlaceModel):
+    """
+    Answers aggregations with `groups` and keeps the pipelines.
+    """
+    groups = []
+    pipelines = []
+
+    @classmethod
+    @gen.coroutine
+    def aggregate_list(cls, db, pipe_list, collection=None, deadline=None):
+        cls.pipelines.append(pipe_list)
+        raise gen.Return([
+            group for group in cls.groups[:pipe_list[-1]["$limit"]]])
+
+
+class CannedStatsHandler(BaseAggregateHandler):
+    model = CannedPlaceModel
+    aggregate_fields = ["kind"]
+
+
+class FewGroupsStatsHandler(CannedStatsHandler):
+    max_groups = 1
+
+
+class CannedValuesHandler(FilterMixin, BaseValuesHandler):
+    model = CannedPlaceModel
+    aggregate_fields = ["kind", "name"]
+    max_values = 1
+
+NEAR = {"$nearSphere": {"$geometry": {"type": "Point",
+                                      "coordinates": [30.5, 50.4]}}}
+
+
+class NearMixin(object):
+    model = PlaceModel
+    aggregate_fields = ["kind"]
+
+    def build_query_spec(self, spec):
+        return spec.filter({"name": NEAR})
+
+
+class PlaceStatsHandler(NearMixin, BaseAggregateHandler):
+    pass
+
+
+class PlaceValuesHandler(NearMixin, BaseValuesHandler):
+    pass
+
+
+class NearConditionTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return Application([
+            (r"/stats", PlaceStatsHandler),
+            (r"/values", PlaceValuesHandler),
+        ], db=None)
+
+    def assertBadRequest(self, path):
+        response = self.fetch(path)
+        self.assertEqual(response.code, 400)
+        self.assertIn("name", json.loads(response.body)["errors"][0])
+
+    def test_aggregate(self):
+        self.assertBadRequest("/stats?$group_by=kind")
+
+    def test_values(self):
+        self.assertBadRequest("/values?$field=kind")
+
+
+class FacetTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return Application([
+            (r"/stats", CannedStatsHandler),
+            (r"/few", FewGroupsStatsHandler),
+        ], db=None)
+
+    def setUp(self):
+        super(FacetTest, self).setUp()
+        CannedPlaceModel.groups = [{"_id": "cafe", "count": 3},
+                                   {"_id": None, "count": 2}]
+        CannedPlaceModel.pipelines = []
+
+    def get_json(self, path):
+        response = self.fetch(path)
+        self.assertEqual(response.code, 200)
+        return json.loads(response.body)
+
+    def test_documents_without_field(self):
+        result = self.get_json("/stats?$facet=kind&$distinct=kind")
+        self.assertEqual(result["facets"]["kind"], [
+            {"value": "cafe", "count": 3}, {"value": None, "count": 2}])
+        self.assertEqual(result["distinct"]["kind"], ["cafe", None])
+        self.assertEqual(
+            CannedPlaceModel.pipelines[0][1]["$group"]["_id"], "$kind")
+
+    def test_handlers_do_not_share_cached_bodies(self):
+        self.assertEqual(
+            len(self.get_json("/stats?$facet=kind")["facets"]["kind"]), 2)
+        self.assertEqual(
+            len(self.get_json("/few?$facet=kind")["facets"]["kind"]), 1)
+
+
+class ValuesTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return Application([(r"/values", CannedValuesHandler)], db=None)
+
+    def setUp(self):
+        super(ValuesTest, self).setUp()
+        CannedPlaceModel.groups = [{"_id": "cafe", "count": 3},
+                                   {"_id": "bar", "count": 2}]
+        CannedPlaceModel.pipelines = []
+
+    def get_json(self, path):
+        response = self.fetch(path)
+        self.assertEqual(response.code, 200)
+        return json.loads(response.body)
+
+    def test_values_with_counts(self):
+        result = self.get_json("/values?$field=kind&name=Bono")
+        self.assertEqual(result, {"field": "kind", "truncated": True,
+                                  "values": [{"value": "cafe", "count": 3}]})
+        pipe = CannedPlaceModel.pipelines[0]
+        self.assertEqual(pipe[0], {"$match": {"name": "Bono"}})
+        self.assertEqual(pipe[1], {"$project": {"_id": 0, "kind": 1}})
+        self.assertEqual(pipe[-2], {"$sort": {"count": -1}})
+
+    def test_sorted_values_are_cached(self):
+        for _ in range(2):
+            result = self.get_json("/values?$field=name&$counts=false")
+            self.assertEqual(result["values"], ["cafe"])
+        self.assertEqual(len(CannedPlaceModel.pipelines), 1)
+        self.assertEqual(CannedPlaceModel.pipelines[0][-2],
+                         {"$sort": {"_id": 1}})
+
+    def test_one_allowed_field(self):
+        for field in ("rating", "kind,name", ""):
+            response = self.fetch("/values?$field=" + field)
+            self.assertEqual(response.code, 400)
@@ -0,0 +1,52 @@
+import json
+
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application, HTTPError
+
+from tornado_rest.base.handlers import BaseBulkHandler
+from tests.test_validation import PlaceModel
+
+
+class PlaceBulkHandler(BaseBulkHandler):
+    model = PlaceModel
+    flushed = []
+
+    def flush_batch(self):
+        self.flushed.append(list(self._batch))
+        return super(PlaceBulkHandler, self).flush_batch()
+
+
+class ForbiddenBulkHandler(PlaceBulkHandler):
+
+    def pre_post(self):
+        raise HTTPError(403)
+
+
+class ReadOnlyBulkHandler(PlaceBulkHandler):
+    allowed_methods = ["options"]
+
+
+class BulkHandlerTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return Application([
+            (r"/forbidden", ForbiddenBulkHandler),
+            (r"/read-only", ReadOnlyBulkHandler),
+        ], db=None)
+
+    def post(self, path):
+        body = "\n".join(json.dumps({"name": "Bono"}) for _ in range(3))
+        return self.fetch(path, method="POST", body=body)
+
+    def setUp(self):
+        super(BulkHandlerTest, self).setUp()
+        PlaceBulkHandler.flushed[:] = []
+
+    def test_pre_post_runs_before_records(self):
+        self.assertEqual(self.post("/forbidden").code, 403)
+        self.assertEqual(PlaceBulkHandler.flushed, [])
+
+    def test_not_allowed(self):
+        response = self.post("/read-only")
+        self.assertEqual(response.code, 405)
+        self.assertEqual(PlaceBulkHandler.flushed, [])
@@ -0,0 +1,124 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from tornado.httpserver import HTTPRequest
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from tornado.web import Application, RequestHandler
+
+from tornado_rest.base.capture import TrafficRecorder
+from tornado_rest.libs import replay
+
+
+class FakeHandler(object):
+
+    def __init__(self, request):
+        self.request = request
+
+    def get_status(self):
+        return 200
+
+
+class TrafficRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "traffic.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record(self, recorder, count):
+        for i in range(count):
+            recorder.record(FakeHandler(HTTPRequest(
+                "POST", "/places?page={0}".format(i),
+                body=json.dumps({"name": "Bono", "password": "x"}))))
+
+    def read(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_lines_left_are_written_on_close(self):
+        recorder = TrafficRecorder(self.path, flush_every=10,
+                                   flush_interval=60)
+        self.record(recorder, 3)
+        recorder.close()
+        entries = self.read()
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(entries[0]["body"],
+                         {"name": "Bono", "password": "***"})
+
+    def test_flush(self):
+        recorder = TrafficRecorder(self.path, flush_every=2,
+                                   flush_interval=60)
+        self.record(recorder, 4)
+        recorder.flush()
+        self.assertEqual(
+            [entry["arguments"]["page"] for entry in self.read()],
+            [["0"], ["1"], ["2"], ["3"]])
+        recorder.close()
+
+
+class EchoHandler(RequestHandler):
+
+    def get(self):
+        if self.get_argument("fail", None):
+            self.send_error(500)
+            return
+        self.write({"page": self.get_argument("page")})
+
+    def post(self):
+        self.write(json.loads(self.request.body))
+
+
+class ReplayTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return Application([(r"/places", EchoHandler)])
+
+    def test_records_are_sorted_by_start(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "traffic.jsonl")
+            with open(path, "w") as f:
+                f.write('{"started": 2, "path": "/b"}\n\n'
+                        '{"started": 1, "path": "/a"}\n')
+            self.assertEqual([record["path"] for record in
+                              replay.load([path])], ["/a", "/b"])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_request(self):
+        request = replay.make_request({
+            "method": "POST", "path": "/places",
+            "arguments": {"tag": [u"caf\xe9", "bar"]},
+            "body": {"name": "Bono"}}, "http://localhost:1/", 5)
+        self.assertEqual(request.url, "http://localhost:1/places"
+                                      "?tag=caf%C3%A9&tag=bar")
+        self.assertEqual(json.loads(request.body), {"name": "Bono"})
+
+    @gen_test
+    def test_report_per_route(self):
+        records = [
+            {"method": "GET", "path": "/places", "route": "list",
+             "arguments": {"page": [str(i)]}} for i in range(4)
+        ] + [
+            {"method": "GET", "path": "/places", "route": "failing",
+             "arguments": {"fail": ["1"]}},
+            {"method": "POST", "path": "/places", "route": "create",
+             "body": {"name": "Bono"}},
+        ]
+        report = yield replay.replay(records, self.get_url(""),
+                                     concurrency=2)
+        rows = dict((row["route"], row) for row in report)
+        self.assertEqual(sorted(rows), ["create", "failing", "list"])
+        self.assertEqual(rows["list"]["count"], 4)
+        self.assertEqual(rows["list"]["statuses"], {200: 4})
+        self.assertEqual(rows["failing"]["errors"], 1)
+        self.assertEqual(rows["create"]["statuses"], {200: 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
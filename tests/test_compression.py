@@ -0,0 +1,62 @@
+import json
+import unittest
+import zlib
+
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+
+from tornado_rest.base.compression import (COMPRESSORS, CompressedBody,
+                                           negotiate)
+from tornado_rest.base.handlers import SimpleHandler
+
+
+class ItemsHandler(SimpleHandler):
+
+    def get(self):
+        count = int(self.get_argument("count"))
+        self.render([{"name": "item {0}".format(i)} for i in range(count)])
+
+
+class NegotiateTest(unittest.TestCase):
+
+    def test_encodings(self):
+        self.assertIsNone(negotiate(None))
+        self.assertIsNone(negotiate("identity"))
+        self.assertIsNone(negotiate("gzip;q=0"))
+        self.assertEqual(negotiate("deflate, gzip"), "gzip")
+        self.assertEqual(negotiate("*;q=0.5"), COMPRESSORS[0][0])
+        self.assertEqual(negotiate("GZIP;q=0.1, unknown;q=1"), "gzip")
+
+    def test_body_is_compressed_once(self):
+        body = CompressedBody(u"caf\xe9" * 100)
+        data = body.encode("gzip")
+        self.assertIs(body.encode("gzip"), data)
+        self.assertEqual(zlib.decompress(data, 16 + zlib.MAX_WBITS),
+                         body.body)
+
+
+class CompressedResponseTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return Application([(r"/items", ItemsHandler)], db=None)
+
+    def get(self, count, accept="gzip"):
+        return self.fetch("/items?count={0}".format(count), use_gzip=False,
+                          headers={"Accept-Encoding": accept})
+
+    def test_large_responses_are_compressed(self):
+        response = self.get(100)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        items = json.loads(zlib.decompress(
+            response.body, 16 + zlib.MAX_WBITS).decode("utf-8"))
+        self.assertEqual(len(items), 100)
+
+    def test_small_or_not_accepted(self):
+        for response in (self.get(1), self.get(100, "identity")):
+            self.assertNotIn("Content-Encoding", response.headers)
+            json.loads(response.body.decode("utf-8"))
+
+
+if __name__ == "__main__":
+    unittest.main()
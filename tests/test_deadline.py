@@ -0,0 +1,104 @@
+import json
+
+from tornado.testing import AsyncHTTPTestCase, AsyncTestCase, gen_test
+from tornado.web import Application
+
+from tornado_rest.base import deadline as deadline_module
+from tornado_rest.base.admission import AdmissionGate, Overloaded
+from tornado_rest.base.deadline import Deadline, DeadlineExceeded
+from tornado_rest.base.handlers import BaseHandler
+from tornado_rest.base.models import BaseModel
+
+
+class FakeCursor(object):
+    max_time = None
+
+    def max_time_ms(self, max_time):
+        self.max_time = max_time
+        return self
+
+
+def not_called(callback):
+    raise AssertionError("operation run after the deadline")
+
+
+class TimeoutHandler(BaseHandler):
+    allowed_methods = ["get"]
+    request_timeout = 5
+
+    def get(self):
+        self.render({"timeout": self.deadline.timeout})
+
+
+class LimitedTimeoutHandler(TimeoutHandler):
+    max_request_timeout = 10
+
+
+class RequestTimeoutTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return Application([
+            (r"/", TimeoutHandler),
+            (r"/limited", LimitedTimeoutHandler),
+        ], db=None)
+
+    def get_timeout(self, header, path="/"):
+        response = self.fetch(path, headers={"X-Request-Timeout": header})
+        if response.code != 200:
+            return response.code
+        return json.loads(response.body)["timeout"]
+
+    def test_default(self):
+        response = self.fetch("/")
+        self.assertEqual(json.loads(response.body)["timeout"], 5)
+
+    def test_header(self):
+        self.assertEqual(self.get_timeout("2.5"), 2.5)
+
+    def test_limited_by_request_timeout(self):
+        self.assertEqual(self.get_timeout("60"), 5)
+
+    def test_limited_by_max_request_timeout(self):
+        self.assertEqual(self.get_timeout("60", "/limited"), 10)
+
+    def test_invalid(self):
+        for header in ("nan", "inf", "-1", "0", "soon"):
+            self.assertEqual(self.get_timeout(header), 400)
+
+
+class DeadlineTest(AsyncTestCase):
+
+    def test_remaining_time_limits_cursor(self):
+        cursor = Deadline(2).limit(FakeCursor())
+        if deadline_module.SERVER_TIME_LIMITS:
+            self.assertTrue(1900 < cursor.max_time <= 2000)
+        else:
+            self.assertIsNone(cursor.max_time)
+
+    @gen_test
+    def test_expired_deadline_stops_operations(self):
+        deadline = Deadline(-1)
+        self.assertTrue(deadline.expired)
+        with self.assertRaises(DeadlineExceeded):
+            deadline.max_time_ms()
+        with self.assertRaises(DeadlineExceeded):
+            yield BaseModel.run_op(not_called, deadline=deadline)
+
+
+class GateDeadlineTest(AsyncTestCase):
+
+    @gen_test
+    def test_wait_ends_with_deadline(self):
+        gate = AdmissionGate("deadline", 1, max_queue=1, timeout=30)
+        yield gate.acquire()
+        with self.assertRaises(DeadlineExceeded):
+            yield gate.acquire(Deadline(0.01))
+        self.assertEqual(gate.queue_depth, 0)
+        self.assertEqual(gate.shed, 0)
+
+    @gen_test
+    def test_queue_timeout_before_deadline(self):
+        gate = AdmissionGate("queue", 1, max_queue=1, timeout=0.01)
+        yield gate.acquire()
+        with self.assertRaises(Overloaded):
+            yield gate.acquire(Deadline(30))
@@ -0,0 +1,78 @@
+import unittest
+
+from tornado_rest.base.mixins import FilterMixin
+from tornado_rest.base.models import BaseModel, GeoPoint
+from tornado_rest.base.query import QuerySpec, InvalidQuery
+
+
+class PlaceModel(BaseModel):
+    MONGO_COLLECTION = "geo_places"
+
+    location = GeoPoint()
+
+
+class SpecBuilder(object):
+
+    def build_query_spec(self, spec):
+        return spec
+
+
+class FakeRequest(object):
+
+    def __init__(self, arguments):
+        self.arguments = dict((name, [value])
+                              for name, value in arguments.items())
+
+
+class PlaceFilter(FilterMixin, SpecBuilder):
+
+    def __init__(self, **arguments):
+        self.request = FakeRequest(arguments)
+
+    def get_argument(self, name, default):
+        values = self.request.arguments.get(name)
+        return values[0] if values else default
+
+    def get_query_model(self):
+        return PlaceModel
+
+
+def build(**arguments):
+    return PlaceFilter(**arguments).build_query_spec(QuerySpec())
+
+
+def ring(spec):
+    return spec.query["location"]["$geoWithin"]["$geometry"][
+        "coordinates"][0]
+
+
+class GeoFilterTest(unittest.TestCase):
+
+    def test_near_sorts_by_distance(self):
+        spec = build(location__near="10.7,59.9", **{"$max_distance": "500"})
+        self.assertEqual(spec.query["location"], {"$nearSphere": {
+            "$geometry": {"type": "Point", "coordinates": [10.7, 59.9]},
+            "$maxDistance": 500.0}})
+        self.assertEqual(spec.sort, [])
+
+    def test_bbox_and_polygon_rings_are_closed(self):
+        self.assertEqual(ring(build(location__within="0,0,2,1")),
+                         [[0, 0], [2, 0], [2, 1], [0, 1], [0, 0]])
+        self.assertEqual(ring(build(location__within="0,0,2,0,1,1")),
+                         [[0, 0], [2, 0], [1, 1], [0, 0]])
+        self.assertEqual(ring(build(location__within="0,0,2,0,1,1,0,0")),
+                         [[0, 0], [2, 0], [1, 1], [0, 0]])
+
+    def test_degenerate_polygons(self):
+        for value in ("1,1", "0,0,2,0,0,0"):
+            with self.assertRaises(InvalidQuery):
+                build(location__within=value)
+
+    def test_invalid_coordinates(self):
+        for value in ("a,b", "1,2,3", "200,0"):
+            with self.assertRaises(InvalidQuery):
+                build(location__near=value)
+
+
+if __name__ == "__main__":
+    unittest.main()
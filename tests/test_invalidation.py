@@ -0,0 +1,95 @@
+from bson.timestamp import Timestamp
+from pymongo.errors import OperationFailure
+from tornado.concurrent import Future
+from tornado.testing import AsyncTestCase, gen_test
+
+from tornado_rest.base.invalidation import MongoCappedTransport, \
+    InvalidationBus, Transport
+
+
+class FakeCursor(object):
+
+    def __init__(self, events, error=None):
+        self.events = list(events)
+        self.error = error
+        self.alive = True
+
+    @property
+    def fetch_next(self):
+        future = Future()
+        if self.error is not None:
+            future.set_exception(self.error)
+        elif self.events:
+            future.set_result(True)
+        else:
+            self.alive = False
+            future.set_result(False)
+        return future
+
+    def next_object(self):
+        return self.events.pop(0)
+
+
+class FakeCollection(object):
+
+    def __init__(self, cursors):
+        self.cursors = cursors
+        self.queries = []
+
+    def find(self, query, **kwargs):
+        self.queries.append(query)
+        return self.cursors.pop(0)
+
+    def insert(self, document, callback):
+        self.inserted = document
+        callback(document["_id"], None)
+
+
+class FailingTransport(Transport):
+
+    def publish(self, event):
+        future = Future()
+        future.set_exception(OperationFailure("not master"))
+        return future
+
+
+class MongoCappedTransportTest(AsyncTestCase):
+
+    def test_tailing_goes_on_after_operation_failure(self):
+        first, second = Timestamp(100, 1), Timestamp(100, 2)
+        collection = FakeCollection([
+            FakeCursor([], OperationFailure("CappedPositionLost")),
+            FakeCursor([{"_id": 2, "ts": second}]),
+        ])
+        transport = MongoCappedTransport(
+            {"invalidation_events": collection}, retry_interval=0)
+        transport._running = True
+        received = []
+
+        def callback(event):
+            received.append(event)
+            transport.stop()
+            self.stop()
+
+        transport._tail(callback, first)
+        self.wait()
+        self.assertEqual(received, [{"_id": 2, "ts": second}])
+        self.assertEqual(collection.queries,
+                         [{"ts": {"$gt": first}}, {"ts": {"$gt": first}}])
+
+    @gen_test
+    def test_published_events_get_server_timestamp(self):
+        collection = FakeCollection([])
+        transport = MongoCappedTransport(
+            {"invalidation_events": collection})
+        yield transport.publish({"collection": "places"})
+        self.assertEqual(list(collection.inserted)[:2], ["_id", "ts"])
+        self.assertEqual(collection.inserted["ts"], Timestamp(0, 0))
+
+
+class InvalidationBusTest(AsyncTestCase):
+
+    @gen_test
+    def test_publish_errors_are_logged(self):
+        bus = InvalidationBus(FailingTransport())
+        yield bus.publish("places", 1)
@@ -0,0 +1,96 @@
+import json
+import unittest
+
+from bson.objectid import ObjectId
+from schematics.types import StringType
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+from tornado.testing import AsyncHTTPTestCase, AsyncTestCase, gen_test
+from tornado.web import Application
+
+from tornado_rest.base.handlers import BaseNestedOneHandler
+from tornado_rest.base.models import BaseModel, ReferenceType
+from tornado_rest.base.replica import get_replica
+
+
+class SlowModel(BaseModel):
+    started = []
+
+    @classmethod
+    def find_one(cls, db, query, deadline=None):
+        cls.started.append(query["_id"])
+        future = Future()
+        IOLoop.current().add_callback(
+            lambda: future.set_result((query["_id"], len(cls.started))))
+        return future
+
+
+class AuthorModel(BaseModel):
+    MONGO_COLLECTION = "lookup_authors"
+    IN_MEMORY = True
+
+    name = StringType()
+
+
+class BookModel(BaseModel):
+    MONGO_COLLECTION = "lookup_books"
+    IN_MEMORY = True
+
+    authors = ReferenceType(AuthorModel)
+
+
+class BookAuthorHandler(BaseNestedOneHandler):
+    model = BookModel
+
+    @gen.coroutine
+    def pre_get(self):
+        yield gen.Task(IOLoop.current().add_callback)
+        self.set_header("X-Checked", "yes")
+
+
+class FindOneEachTest(AsyncTestCase):
+
+    @gen_test
+    def test_lookups_run_concurrently(self):
+        SlowModel.started[:] = []
+        result = yield BaseModel.find_one_each(None, [
+            (SlowModel, {"_id": 1}), (SlowModel, {"_id": 2})])
+        # both lookups were started before the first one completed
+        self.assertEqual(result, [(1, 2), (2, 2)])
+
+
+class NestedOneHandlerTest(AsyncHTTPTestCase):
+
+    def setUp(self):
+        super(NestedOneHandlerTest, self).setUp()
+        self.author_id = ObjectId()
+        get_replica(AuthorModel)._rebuild([
+            {"_id": self.author_id, "name": "Hamsun"}])
+        self.book_id = ObjectId()
+        get_replica(BookModel)._rebuild([
+            {"_id": self.book_id, "authors": [self.author_id]}])
+
+    def get_app(self):
+        return Application([
+            (r"/books/([^/]+)/([^/]+)/([^/]+)", BookAuthorHandler),
+        ], db=None)
+
+    def test_coroutine_hook(self):
+        response = self.fetch("/books/{0}/authors/{1}".format(
+            self.book_id, self.author_id))
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers["X-Checked"], "yes")
+        self.assertEqual(json.loads(response.body)["name"], "Hamsun")
+
+    def test_missing_parent_or_nested_object(self):
+        for book_id, author_id in ((ObjectId(), self.author_id),
+                                   (self.book_id, ObjectId())):
+            response = self.fetch(
+                "/books/{0}/authors/{1}".format(book_id, author_id),
+                method="DELETE")
+            self.assertEqual(response.code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import json
+
+from bson.objectid import ObjectId
+from schematics.types import StringType
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+
+from tornado_rest.base.handlers import BaseNestedManyHandler
+from tornado_rest.base.mixins import FilterMixin, SortMixin, \
+    PaginationMixin
+from tornado_rest.base.models import BaseModel, ReferenceType
+from tornado_rest.base.replica import get_replica
+
+
+class TagModel(BaseModel):
+    MONGO_COLLECTION = "nested_tags"
+    IN_MEMORY = True
+
+    name = StringType()
+    kind = StringType()
+
+
+class PostModel(BaseModel):
+    MONGO_COLLECTION = "nested_posts"
+    IN_MEMORY = True
+
+    tags = ReferenceType(TagModel)
+
+
+class PostTagsHandler(FilterMixin, SortMixin, PaginationMixin,
+                      BaseNestedManyHandler):
+    model = PostModel
+
+
+class NestedPaginationTest(AsyncHTTPTestCase):
+
+    def setUp(self):
+        super(NestedPaginationTest, self).setUp()
+        n0, n1, n2 = ObjectId(), ObjectId(), ObjectId()
+        get_replica(TagModel)._rebuild([
+            {"_id": _id, "name": name, "kind": "tag"}
+            for _id, name in ((n0, "n0"), (n1, "n1"), (n2, "n2"))])
+        self.post_id = ObjectId()
+        get_replica(PostModel)._rebuild([
+            {"_id": self.post_id, "tags": [n2, n0, n1]}])
+
+    def get_app(self):
+        return Application([
+            (r"/posts/([^/]+)/([^/]+)", PostTagsHandler),
+        ], db=None)
+
+    def get_names(self, arguments):
+        response = self.fetch("/posts/{0}/tags?{1}".format(
+            self.post_id, arguments))
+        self.assertEqual(response.code, 200)
+        return [item["name"] for item in json.loads(response.body)]
+
+    def test_pages_follow_array_order(self):
+        self.assertEqual(self.get_names("$display=2"), ["n2", "n0"])
+        self.assertEqual(self.get_names("$display=2&$page=1"), ["n1"])
+
+    def test_filter_and_sort_use_nested_query(self):
+        self.assertEqual(self.get_names("$display=2&kind=tag"),
+                         ["n0", "n1"])
+        self.assertEqual(self.get_names("$display=2&$sort=_id"),
+                         ["n0", "n1"])
+        self.assertEqual(self.get_names("$sort=-name"), ["n2", "n1", "n0"])
+
+    def test_zero_display(self):
+        response = self.fetch("/posts/{0}/tags?$display=0".format(
+            self.post_id))
+        self.assertEqual(response.code, 400)
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tornado.httpserver import HTTPRequest
+
+from tornado_rest.base.profiling import (collapse, current_profile,
+                                         Profiler, PROFILE_HEADER)
+
+
+def stats_entry(tt, ct, callers):
+    return (1, 1, tt, ct, callers)
+
+
+class CollapseTest(unittest.TestCase):
+
+    def test_time_is_split_by_calls(self):
+        main = ("app.py", 1, "main")
+        get = ("app.py", 10, "get")
+        post = ("app.py", 20, "post")
+        encode = ("~", 0, "<json.encode>")
+        stats = {
+            main: stats_entry(0.0, 4.0, {}),
+            get: stats_entry(1.0, 2.0, {main: (1, 1, 1.0, 2.0)}),
+            post: stats_entry(1.0, 2.0, {main: (1, 1, 1.0, 2.0)}),
+            encode: stats_entry(2.0, 2.0, {get: (1, 1, 1.0, 1.0),
+                                           post: (1, 1, 1.0, 1.0)}),
+        }
+        self.assertEqual(collapse(stats), {
+            "app.py:1:main;app.py:10:get": 1.0,
+            "app.py:1:main;app.py:20:post": 1.0,
+            "app.py:1:main;app.py:10:get;<json.encode>": 1.0,
+            "app.py:1:main;app.py:20:post;<json.encode>": 1.0,
+        })
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.profiler = Profiler(secret="s3cret", directory=self.directory)
+
+    def tearDown(self):
+        self.profiler.close()
+        shutil.rmtree(self.directory)
+
+    def profile(self):
+        request = HTTPRequest("GET", "/places",
+                              headers={PROFILE_HEADER: "s3cret"})
+        self.assertTrue(self.profiler.wants(request))
+        profile = self.profiler.start(request, "PlacesHandler")
+        with profile.active():
+            self.assertIs(current_profile(), profile)
+            sum(range(1000))
+            profile.add_wait("PlaceModel.find_one", 0.25)
+        self.assertIsNone(current_profile())
+        self.profiler.finish(profile)
+        return profile
+
+    def test_secret_header(self):
+        self.assertFalse(self.profiler.wants(HTTPRequest("GET", "/places")))
+
+    def test_profile_is_written_by_writer_thread(self):
+        profile = self.profile()
+        self.profiler.flush()
+        path = os.path.join(self.directory,
+                            "{0}.collapsed".format(profile.id))
+        with open(path) as f:
+            self.assertEqual(f.read(), profile.collapsed())
+        self.assertIn(
+            "PlacesHandler;motor.Op;PlaceModel.find_one 250000\n",
+            profile.collapsed())
+        self.assertEqual(profile.summary()["mongo_ops"],
+                         {"PlaceModel.find_one": 1})
+        self.assertIs(self.profiler.get(profile.id), profile)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import json
+import unittest
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from schematics.transforms import blacklist
+from schematics.types import DateTimeType, StringType
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+
+from tornado_rest.base.handlers import BaseManyHandler
+from tornado_rest.base.mixins import OnlyMixin, ExcludeMixin
+from tornado_rest.base.models import BaseModel
+from tornado_rest.base.projection import projected_names
+from tornado_rest.base.query import QuerySpec, TEXT_SCORE, TEXT_SCORE_META
+from tornado_rest.base.replica import get_replica
+
+
+class EventModel(BaseModel):
+    MONGO_COLLECTION = "projection_events"
+    IN_MEMORY = True
+
+    title = StringType()
+    city = StringType()
+    starts = DateTimeType()
+    secret = StringType()
+
+    class Options:
+        roles = {"role": blacklist("secret")}
+
+
+class EventsHandler(OnlyMixin, ExcludeMixin, BaseManyHandler):
+    model = EventModel
+
+
+class MergeProjectionTest(unittest.TestCase):
+
+    def merge(self, *projections):
+        spec = QuerySpec()
+        for fields in projections:
+            spec = spec.merge_projection(fields)
+        return spec.fields
+
+    def test_only_and_exclude_in_any_order(self):
+        only, exclude = {"title": 1, "city": 1}, {"city": 0}
+        self.assertEqual(self.merge(only, exclude), {"title": 1})
+        self.assertEqual(self.merge(exclude, only), {"title": 1})
+        self.assertEqual(self.merge(exclude, {"title": 0}),
+                         {"city": 0, "title": 0})
+
+    def test_id(self):
+        self.assertEqual(self.merge({"title": 1}, {"_id": 0}),
+                         {"title": 1, "_id": 0})
+        self.assertEqual(self.merge({"title": 1}, {"title": 0}),
+                         {"_id": 1})
+
+    def test_computed_fields_are_kept(self):
+        spec = QuerySpec().search("jazz").merge_projection({"title": 1})
+        self.assertEqual(spec.fields,
+                         {"title": 1, TEXT_SCORE: TEXT_SCORE_META})
+
+    def test_projected_names(self):
+        fields = ["_id", "title", "city"]
+        self.assertEqual(projected_names(fields, {"title": 1}),
+                         ["title", "_id"])
+        self.assertEqual(projected_names(fields, {"title": 1, "_id": 0}),
+                         ["title"])
+        self.assertEqual(projected_names(fields, {"city": 0}),
+                         ["_id", "title"])
+
+
+class ProjectedReadTest(AsyncHTTPTestCase):
+
+    def setUp(self):
+        super(ProjectedReadTest, self).setUp()
+        self.event_id = ObjectId()
+        get_replica(EventModel)._rebuild([{
+            "_id": self.event_id, "title": "Jazz", "city": "Oslo",
+            "starts": datetime(2014, 5, 1, 20), "secret": "x"}])
+
+    def get_app(self):
+        return Application([(r"/events", EventsHandler)], db=None)
+
+    def get(self, arguments):
+        response = self.fetch("/events?" + arguments)
+        self.assertEqual(response.code, 200)
+        return json.loads(response.body)
+
+    def test_only_projected_fields_are_serialized(self):
+        self.assertEqual(self.get("$only=title,starts,city&$exclude=city"),
+                         [{"_id": str(self.event_id), "title": "Jazz",
+                           "starts": "2014-05-01T20:00:00.000000"}])
+        self.assertEqual(self.get("$exclude=_id,starts,title"),
+                         [{"city": "Oslo"}])
+
+    def test_hidden_and_unknown_fields(self):
+        self.assertEqual(self.get("$only=title,secret&$exclude=_id"),
+                         [{"title": "Jazz"}])
+        self.assertEqual(self.fetch("/events?$only=owner").code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import json
+import unittest
+
+from bson.objectid import ObjectId
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+
+from tornado_rest.base.handlers import BaseManyHandler
+from tornado_rest.base.mixins import FilterMixin, SortMixin, \
+    PaginationMixin
+from tornado_rest.base.query import QuerySpec, InvalidQuery, DEFAULT_SORT
+from tornado_rest.base.replica import get_replica
+from tests.test_validation import PlaceModel
+
+
+class CachedPlaceModel(PlaceModel):
+    MONGO_COLLECTION = "query_places"
+    IN_MEMORY = True
+
+
+class PlacesHandler(FilterMixin, SortMixin, PaginationMixin,
+                    BaseManyHandler):
+    model = CachedPlaceModel
+
+
+class FakeCursor(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def __getitem__(self, name):
+        return self
+
+    def find(self, query, fields=None):
+        self.calls.append(("find", query, fields))
+        return self
+
+    def __getattr__(self, name):
+        def call(*args):
+            self.calls.append((name,) + args)
+            return self
+        return call
+
+
+class QuerySpecValidateTest(unittest.TestCase):
+
+    def test_zero_display(self):
+        with self.assertRaises(InvalidQuery):
+            QuerySpec().paginate(0, 0).validate(PlaceModel)
+
+    def test_negative_page(self):
+        with self.assertRaises(InvalidQuery):
+            QuerySpec().paginate(-20, 20).validate(PlaceModel)
+
+    def test_valid(self):
+        QuerySpec().filter({"name": "Bono"}).paginate(20, 20) \
+            .validate(PlaceModel)
+
+    def test_unknown_fields(self):
+        with self.assertRaises(InvalidQuery) as error:
+            QuerySpec().filter({"city": "Oslo"}).order_by([("size", 1)]) \
+                .project({"owner": 1}).validate(PlaceModel)
+        self.assertEqual(len(error.exception.errors), 3)
+
+
+class QuerySpecTest(unittest.TestCase):
+
+    def test_specs_are_not_changed_in_place(self):
+        spec = QuerySpec()
+        filtered = spec.filter({"name": "Bono"}).filter({"kind": "bar"})
+        self.assertEqual(spec.query, {})
+        self.assertEqual(filtered.query, {"name": "Bono", "kind": "bar"})
+        self.assertEqual(filtered.sort, DEFAULT_SORT)
+        self.assertEqual(filtered.where({"rating": 1}).query, {"rating": 1})
+
+    def test_cursor(self):
+        db = FakeCursor()
+        QuerySpec().filter({"kind": "bar"}).order_by([("rating", -1)]) \
+            .paginate(40, 20).get_cursor(db, PlaceModel)
+        self.assertEqual(db.calls, [
+            ("find", {"kind": "bar"}, None),
+            ("sort", [("rating", -1)]),
+            ("skip", 40),
+            ("limit", 20),
+        ])
+
+
+class ManyHandlerQueryTest(AsyncHTTPTestCase):
+
+    def setUp(self):
+        super(ManyHandlerQueryTest, self).setUp()
+        get_replica(CachedPlaceModel)._rebuild([
+            {"_id": ObjectId(), "name": name, "kind": kind, "rating": rating}
+            for name, kind, rating in (("Fram", "bar", 4), ("Dora", "cafe", 5),
+                                       ("Lund", "bar", 2))])
+
+    def get_app(self):
+        return Application([(r"/places", PlacesHandler)], db=None)
+
+    def get_names(self, arguments):
+        response = self.fetch("/places?" + arguments)
+        self.assertEqual(response.code, 200)
+        return [item["name"] for item in json.loads(response.body)]
+
+    def test_mixins_build_one_query(self):
+        self.assertEqual(self.get_names("kind=bar&$sort=-rating"),
+                         ["Fram", "Lund"])
+        self.assertEqual(
+            self.get_names("name__gte=E&$sort=name&$display=1&$page=1"),
+            ["Lund"])
+
+    def test_invalid_query(self):
+        self.assertEqual(self.fetch("/places?$sort=size").code, 400)
+        self.assertEqual(self.fetch("/places?$page=first").code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import json
+import unittest
+
+from bson.objectid import ObjectId
+from schematics.transforms import blacklist
+from schematics.types import IntType, StringType
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+
+from tornado_rest.base.handlers import BaseManyHandler
+from tornado_rest.base.mixins import OnlyMixin, ExcludeMixin
+from tornado_rest.base.models import BaseModel
+from tornado_rest.base.replica import get_replica
+
+
+class AccountModel(BaseModel):
+    MONGO_COLLECTION = "raw_accounts"
+    IN_MEMORY = True
+
+    name = StringType()
+    age = IntType()
+    password = StringType()
+
+    class Options:
+        roles = {"role": blacklist("password")}
+
+
+class RawAccountsHandler(OnlyMixin, ExcludeMixin, BaseManyHandler):
+    model = AccountModel
+    read_mode = 'raw'
+
+
+class RawProjectionTest(unittest.TestCase):
+
+    def test_hidden_fields_are_never_projected(self):
+        self.assertEqual(AccountModel.raw_projection(),
+                         {"_id": 1, "name": 1, "age": 1})
+        self.assertEqual(AccountModel.raw_projection({"password": 1}),
+                         {"_id": 1})
+        self.assertEqual(AccountModel.raw_projection({"age": 0}),
+                         {"_id": 1, "name": 1})
+        self.assertEqual(AccountModel.raw_projection({"name": 1}),
+                         {"_id": 0, "name": 1})
+
+    def test_raw_to_json(self):
+        _id = ObjectId()
+        self.assertEqual(AccountModel.raw_to_json({"_id": _id}),
+                         {"_id": str(_id)})
+
+
+class RawHandlerTest(AsyncHTTPTestCase):
+
+    def setUp(self):
+        super(RawHandlerTest, self).setUp()
+        self.account_id = ObjectId()
+        get_replica(AccountModel)._rebuild([{
+            "_id": self.account_id, "name": "Ola", "age": 40,
+            "password": "x", "legacy": True}])
+
+    def get_app(self):
+        return Application([(r"/accounts", RawAccountsHandler)], db=None)
+
+    def get(self, arguments=""):
+        response = self.fetch("/accounts?" + arguments)
+        self.assertEqual(response.code, 200)
+        return json.loads(response.body)
+
+    def test_documents_are_rendered_as_stored(self):
+        self.assertEqual(self.get(), [
+            {"_id": str(self.account_id), "name": "Ola", "age": 40}])
+
+    def test_projection(self):
+        self.assertEqual(self.get("$only=name,password"), [{"name": "Ola"}])
+        self.assertEqual(self.get("$exclude=_id,age"), [{"name": "Ola"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import json
+import unittest
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+
+from tornado_rest.base.handlers import BaseManyHandler
+from tornado_rest.base.replica import get_replica
+from tests.test_projection import EventModel
+
+
+class EventRecordsHandler(BaseManyHandler):
+    model = EventModel
+    read_mode = 'record'
+
+
+class RecordTest(unittest.TestCase):
+
+    def setUp(self):
+        self.event_id = ObjectId()
+        self.record = EventModel.make_result({
+            "_id": self.event_id, "title": "Jazz", "legacy": 1}, 'record',
+            "find_one")
+
+    def test_fields_are_read_only_slots(self):
+        self.assertIs(EventModel.get_record_class(), type(self.record))
+        self.assertFalse(hasattr(self.record, "__dict__"))
+        self.assertEqual(self.record.title, "Jazz")
+        self.assertEqual(self.record["_id"], self.event_id)
+        self.assertIsNone(self.record.city)
+        with self.assertRaises(AttributeError):
+            self.record.title = "Blues"
+        with self.assertRaises(KeyError):
+            self.record["legacy"]
+
+    def test_to_model(self):
+        model = self.record.to_model()
+        self.assertIsInstance(model, EventModel)
+        self.assertEqual(model.title, "Jazz")
+
+
+class RecordHandlerTest(AsyncHTTPTestCase):
+
+    def setUp(self):
+        super(RecordHandlerTest, self).setUp()
+        self.event_id = ObjectId()
+        get_replica(EventModel)._rebuild([{
+            "_id": self.event_id, "title": "Jazz", "city": "Oslo",
+            "starts": datetime(2014, 5, 1, 20), "secret": "x"}])
+
+    def get_app(self):
+        return Application([(r"/events", EventRecordsHandler)], db=None)
+
+    def test_records_are_serialized_like_models(self):
+        response = self.fetch("/events")
+        self.assertEqual(response.code, 200)
+        self.assertEqual(json.loads(response.body), [{
+            "_id": str(self.event_id), "title": "Jazz", "city": "Oslo",
+            "starts": "2014-05-01T20:00:00.000000"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from datetime import datetime
+
+from tornado.ioloop import IOLoop
+from tornado.testing import AsyncTestCase, gen_test
+
+from tornado_rest.base import replica as replica_module
+from tornado_rest.base.models import BaseModel
+from tornado_rest.base.replica import match_condition, Replica
+
+
+class CityModel(BaseModel):
+    MONGO_COLLECTION = "replica_cities"
+
+
+class FakeCursor(object):
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def to_list(self, length, callback):
+        IOLoop.current().add_callback(
+            callback, list(self.documents[:length]), None)
+
+
+class FakeDb(object):
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def __getitem__(self, name):
+        return self
+
+    def find(self):
+        return FakeCursor(self.documents)
+
+
+class MatchConditionTest(unittest.TestCase):
+
+    def test_numbers(self):
+        self.assertTrue(match_condition(5, {"$lt": 10}))
+        self.assertTrue(match_condition(5.5, {"$gte": 5}))
+        self.assertFalse(match_condition(15, {"$lt": 10}))
+
+    def test_types_are_not_compared(self):
+        self.assertFalse(match_condition(5, {"$lt": "10"}))
+        self.assertFalse(match_condition("5", {"$gt": 1}))
+        self.assertFalse(match_condition(True, {"$gte": 0}))
+        self.assertFalse(
+            match_condition(datetime(2014, 1, 1), {"$gt": 0}))
+
+    def test_null(self):
+        self.assertFalse(match_condition(None, {"$lt": 5}))
+        self.assertFalse(match_condition(None, {"$lte": 5}))
+        self.assertTrue(match_condition(None, {"$lte": None}))
+
+    def test_lists_match_any_item(self):
+        self.assertTrue(match_condition([1, "a", 20], {"$gt": 10}))
+        self.assertFalse(match_condition(["a", "b"], {"$gt": 10}))
+
+
+class ReplicaLoadTest(AsyncTestCase):
+
+    @gen_test
+    def test_truncated_collection_is_not_loaded(self):
+        replica = Replica(CityModel)
+        max_len = replica_module.MAX_REPLICA_LEN
+        replica_module.MAX_REPLICA_LEN = 2
+        try:
+            yield replica.load(FakeDb([{"_id": i} for i in range(3)]))
+        finally:
+            replica_module.MAX_REPLICA_LEN = max_len
+        self.assertFalse(replica.loaded)
+        self.assertIsNone(replica.find({}))
+
+    def test_changed_reloads_in_background(self):
+        db = FakeDb([{"_id": 1}])
+        replica = Replica(CityModel)
+        replica.start(db).add_done_callback(lambda f: self.stop())
+        self.wait()
+        self.assertEqual(replica.find({}), [{"_id": 1}])
+
+        db.documents = [{"_id": 1}, {"_id": 2}]
+        replica.changed()
+        self.assertIsNone(replica.find({}))
+        self.io_loop.add_timeout(self.io_loop.time() + 0.05, self.stop)
+        self.wait()
+        self.assertEqual(len(replica.find({})), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
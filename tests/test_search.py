@@ -0,0 +1,84 @@
+import unittest
+
+from schematics.types import FloatType, StringType
+
+from tornado_rest.base.mixins import SearchMixin, SortMixin
+from tornado_rest.base.models import BaseModel
+from tornado_rest.base.query import (QuerySpec, InvalidQuery, TEXT_SCORE,
+                                     TEXT_SCORE_META)
+
+
+class ReviewModel(BaseModel):
+    MONGO_COLLECTION = "search_reviews"
+    MONGO_TEXT_FIELDS = {"title": 3, "text": 1}
+
+    title = StringType()
+    text = StringType()
+    score = FloatType()
+
+
+class ScoredModel(BaseModel):
+    MONGO_COLLECTION = "search_scored"
+    MONGO_TEXT_FIELDS = ["title"]
+
+    title = StringType()
+    _score = FloatType()
+
+
+class SpecBuilder(object):
+
+    def build_query_spec(self, spec):
+        return spec
+
+
+class ReviewSearch(SearchMixin, SortMixin, SpecBuilder):
+
+    def __init__(self, model=ReviewModel, **arguments):
+        self.model = model
+        self.arguments = arguments
+
+    def get_argument(self, name, default, strip=True):
+        return self.arguments.get(name, default)
+
+    def get_query_model(self):
+        return self.model
+
+
+def build(model=ReviewModel, **arguments):
+    spec = ReviewSearch(model, **arguments).build_query_spec(QuerySpec())
+    spec.validate(model)
+    return spec
+
+
+class SearchTest(unittest.TestCase):
+
+    def test_text_index(self):
+        self.assertEqual(ReviewModel.get_indexes(), [(
+            [("text", "text"), ("title", "text")],
+            {"weights": {"title": 3, "text": 1}, "name": "text"})])
+
+    def test_search_sorts_by_relevance(self):
+        spec = build(**{"$search": "quiet room"})
+        self.assertEqual(spec.query, {"$text": {"$search": "quiet room"}})
+        self.assertEqual(spec.fields, {TEXT_SCORE: TEXT_SCORE_META})
+        self.assertEqual(spec.sort, [(TEXT_SCORE, TEXT_SCORE_META)])
+
+    def test_relevance_does_not_hide_score_field(self):
+        spec = build(**{"$search": "quiet", "$sort": "-score,_score"})
+        self.assertEqual(spec.sort, [("score", -1),
+                                     (TEXT_SCORE, TEXT_SCORE_META)])
+        self.assertEqual(spec.fields, {TEXT_SCORE: TEXT_SCORE_META})
+
+    def test_relevance_sort_needs_search(self):
+        with self.assertRaises(InvalidQuery):
+            build(**{"$sort": "_score"})
+
+    def test_unsupported_search(self):
+        with self.assertRaises(InvalidQuery):
+            build(ScoredModel, **{"$search": "quiet"})
+        with self.assertRaises(InvalidQuery):
+            build(BaseModel, **{"$search": "quiet"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import unittest
+from functools import partial
+
+from tornado.ioloop import IOLoop
+from tornado.testing import AsyncTestCase, gen_test
+
+from schematics.types import StringType
+
+from tornado_rest.base.models import BaseModel, GeoPoint
+from tornado_rest.base.query import QuerySpec, InvalidQuery
+from tornado_rest.base.routing import (split_pipeline, merge_aggregation,
+                                       register_connection, shard_for)
+
+
+class GatedModel(BaseModel):
+    MONGO_COLLECTION = "gated"
+    MAX_IN_FLIGHT_OPS = 1
+    MAX_QUEUED_OPS = 0
+
+
+class FakeShard(object):
+
+    def __init__(self, documents=()):
+        self.documents = list(documents)
+        self.updates = []
+
+    def __getitem__(self, name):
+        return self
+
+    def find(self, query, fields=None):
+        return self
+
+    def find_one(self, query, fields, callback):
+        found = next((doc for doc in self.documents
+                      if all(doc.get(k) == v for k, v in query.items())),
+                     None)
+        IOLoop.current().add_callback(callback, found, None)
+
+    def update(self, query, document, upsert, multi, callback):
+        self.updates.append((query, document))
+        IOLoop.current().add_callback(callback, {"n": 1}, None)
+
+
+class ShardedPlaceModel(BaseModel):
+    MONGO_COLLECTION = "sharded_places"
+    SHARDS = ["test_shard_a", "test_shard_b"]
+    SHARD_KEY = "city"
+
+    city = StringType()
+    name = StringType()
+    location = GeoPoint()
+
+
+def op(value, callback):
+    IOLoop.current().add_callback(callback, value, None)
+
+
+def aggregate(pipe_list, shard_results):
+    shard_pipe, group, tail = split_pipeline(pipe_list)
+    return shard_pipe, merge_aggregation(group, tail, shard_results)
+
+
+class MergeAggregationTest(unittest.TestCase):
+
+    def test_groups_are_merged_and_limited(self):
+        shard_pipe, result = aggregate([
+            {"$match": {}},
+            {"$group": {"_id": "$city", "count": {"$sum": 1},
+                        "low": {"$min": "$rating"},
+                        "avg": {"$avg": "$rating"}}},
+            {"$sort": {"count": -1}},
+            {"$limit": 2},
+        ], [
+            [{"_id": "Oslo", "count": 2, "low": 3, "avg": 7,
+              "avg__avg_count": 2},
+             {"_id": "Rome", "count": 2, "low": 1, "avg": 2,
+              "avg__avg_count": 2}],
+            [{"_id": "Oslo", "count": 2, "low": 1, "avg": 1,
+              "avg__avg_count": 1},
+             {"_id": "Kyiv", "count": 3, "low": None, "avg": 0,
+              "avg__avg_count": 0}],
+        ])
+        self.assertEqual(shard_pipe[1]["$group"]["avg"],
+                         {"$sum": "$rating"})
+        self.assertEqual(len(shard_pipe), 2)
+        self.assertEqual(result, [
+            {"_id": "Oslo", "count": 4, "low": 1, "avg": 8 / 3.0},
+            {"_id": "Kyiv", "count": 3, "low": None, "avg": None},
+        ])
+
+    def test_pipeline_without_group_is_sorted_again(self):
+        _, result = aggregate(
+            [{"$match": {}}, {"$sort": {"a": 1}}, {"$skip": 1}],
+            [[{"a": 1}, {"a": 4}], [{"a": 2}]])
+        self.assertEqual(result, [{"a": 2}, {"a": 4}])
+
+    def test_unmergeable_pipeline(self):
+        with self.assertRaises(ValueError):
+            split_pipeline([{"$group": {"_id": None,
+                                        "names": {"$push": "$name"}}}])
+        with self.assertRaises(ValueError):
+            split_pipeline([{"$limit": 5}, {"$group": {"_id": None}}])
+
+
+class ScatterTest(AsyncTestCase):
+
+    @gen_test
+    def test_scatter_holds_one_slot(self):
+        results = yield GatedModel.scatter([
+            partial(GatedModel.run_op, op, value) for value in range(3)])
+        self.assertEqual(results, [0, 1, 2])
+        self.assertEqual(GatedModel.get_ops_gate().in_flight, 0)
+
+
+class RoutingTest(AsyncTestCase):
+
+    def setUp(self):
+        super(RoutingTest, self).setUp()
+        self.shards = {name: FakeShard() for name in ShardedPlaceModel.SHARDS}
+        for name, shard in self.shards.items():
+            register_connection(name, shard)
+        self.oslo = self.shards[shard_for("Oslo", ShardedPlaceModel.SHARDS)]
+        self.oslo.documents.append({"_id": 1, "city": "Oslo"})
+
+    @gen_test
+    def test_update_goes_to_stored_shard(self):
+        yield ShardedPlaceModel.update_document(
+            None, {"_id": 1}, {"name": "Fram", "city": "Oslo"})
+        self.assertEqual(self.oslo.updates, [
+            ({"_id": 1}, {"$set": {"name": "Fram", "city": "Oslo"}})])
+        self.assertEqual(
+            sum(len(shard.updates) for shard in self.shards.values()), 1)
+
+    @gen_test
+    def test_shard_key_change_is_rejected(self):
+        with self.assertRaises(ValueError):
+            yield ShardedPlaceModel.update_document(
+                None, {"_id": 1}, {"city": "Rome"})
+        with self.assertRaises(ValueError):
+            yield ShardedPlaceModel.update_document(
+                None, {"name": "Fram"}, {"city": "Rome"}, multi=True)
+        self.assertEqual(self.oslo.updates, [])
+
+    def test_near_needs_shard_key(self):
+        near = {"location": {"$nearSphere": {"$geometry": {
+            "type": "Point", "coordinates": [10.7, 59.9]}}}}
+        with self.assertRaises(ValueError):
+            ShardedPlaceModel.get_cursor(None, near)
+        with self.assertRaises(InvalidQuery):
+            QuerySpec().filter(near).validate(ShardedPlaceModel)
+        near["city"] = "Oslo"
+        self.assertIs(ShardedPlaceModel.get_cursor(None, near), self.oslo)
+        QuerySpec().filter(near).validate(ShardedPlaceModel)
+
+
+if __name__ == "__main__":
+    unittest.main()
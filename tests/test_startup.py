@@ -0,0 +1,81 @@
+import json
+import unittest
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.testing import AsyncHTTPTestCase, AsyncTestCase, gen_test
+from tornado.web import Application
+
+from tornado_rest.base.handlers import ReadinessHandler
+from tornado_rest.libs.db import (ensure_indexes, load_replicas, warm_models,
+                                  warm_pool)
+from tests.test_validation import PlaceModel
+
+
+class FakeDb(object):
+
+    def __init__(self):
+        self.commands = []
+
+    def command(self, name, callback):
+        self.commands.append(name)
+        IOLoop.current().add_callback(callback, {"ok": 1}, None)
+
+
+class RecordingModel(object):
+    calls = []
+
+    @classmethod
+    @gen.coroutine
+    def ensure_indexes(cls, db):
+        cls.calls.append(("ensure_indexes", db))
+
+    @classmethod
+    @gen.coroutine
+    def load_replica(cls, db):
+        cls.calls.append(("load_replica", db))
+
+
+class WarmupTest(AsyncTestCase):
+
+    @gen_test
+    def test_pool_is_warmed_with_pings(self):
+        db = FakeDb()
+        yield warm_pool(db, 3)
+        self.assertEqual(db.commands, ["ping"] * 3)
+        yield warm_pool(db, 0)
+        self.assertEqual(len(db.commands), 3)
+
+    @gen_test
+    def test_indexes_and_replicas_of_given_models(self):
+        RecordingModel.calls[:] = []
+        yield ensure_indexes("db", [RecordingModel])
+        yield load_replicas("db", [RecordingModel])
+        self.assertEqual(RecordingModel.calls, [
+            ("ensure_indexes", "db"), ("load_replica", "db")])
+
+    def test_model_metadata(self):
+        warm_models([PlaceModel])
+        self.assertIn('_read_fields', PlaceModel.__dict__)
+        self.assertIn('_validator', PlaceModel.__dict__)
+
+
+class ReadinessTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        self.app = Application([(r"/ready", ReadinessHandler)],
+                               db=None, ready=False)
+        return self.app
+
+    def test_ready_after_startup(self):
+        response = self.fetch("/ready")
+        self.assertEqual(response.code, 503)
+        self.assertEqual(json.loads(response.body), {"ready": False})
+        self.assertEqual(self.fetch("/ready", method="HEAD").code, 503)
+        self.app.settings["ready"] = True
+        self.assertEqual(self.fetch("/ready").code, 200)
+        self.assertEqual(self.fetch("/ready", method="HEAD").code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
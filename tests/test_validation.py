@@ -0,0 +1,89 @@
+import unittest
+
+from schematics.exceptions import BaseError, ValidationError
+from schematics.types import StringType, IntType
+
+from tornado_rest.base.models import BaseModel
+
+
+class PlaceModel(BaseModel):
+    MONGO_COLLECTION = "places"
+
+    name = StringType(required=True)
+    kind = StringType(choices=["cafe", "bar"])
+    rating = IntType(min_value=0, max_value=5)
+
+
+class CheckedPlaceModel(PlaceModel):
+
+    def validate_rating(self, data, value):
+        if value == 3:
+            raise ValidationError("Rating 3 is not allowed")
+        return value
+
+
+class ValidatedPlaceModel(PlaceModel):
+
+    def validate(self, *args, **kwargs):
+        super(ValidatedPlaceModel, self).validate(*args, **kwargs)
+
+
+def model_errors(model, data):
+    try:
+        model(data).validate(strict=True)
+    except BaseError as e:
+        return e.messages
+    return None
+
+
+def fast_errors(model, data):
+    try:
+        model.get_validator().validate(data)
+    except BaseError as e:
+        return e.messages
+    return None
+
+
+class FastValidatorTest(unittest.TestCase):
+
+    def assertSameErrors(self, data):
+        expected = model_errors(PlaceModel, data)
+        self.assertEqual(fast_errors(PlaceModel, data), expected)
+        return expected
+
+    def test_valid(self):
+        data = {"name": "Bono", "kind": "cafe", "rating": 4}
+        self.assertIsNone(self.assertSameErrors(data))
+        self.assertEqual(
+            PlaceModel.get_validator().validate(data),
+            PlaceModel(data).get_data_for_save(None))
+
+    def test_required(self):
+        self.assertIn("name", self.assertSameErrors({"kind": "bar"}))
+
+    def test_choices(self):
+        errors = self.assertSameErrors({"name": "Bono", "kind": "club"})
+        self.assertIn("kind", errors)
+
+    def test_conversion(self):
+        errors = self.assertSameErrors({"name": "Bono", "rating": "high"})
+        self.assertIn("rating", errors)
+
+    def test_range(self):
+        self.assertIn("rating",
+                      self.assertSameErrors({"name": "Bono", "rating": 9}))
+
+    def test_rogue(self):
+        self.assertIn("owner",
+                      self.assertSameErrors({"name": "Bono", "owner": 1}))
+
+    def test_model_level_validation(self):
+        data = {"name": "Bono", "rating": 3}
+        self.assertIn("rating", model_errors(CheckedPlaceModel, data))
+        self.assertFalse(CheckedPlaceModel.get_validator().supported)
+        self.assertFalse(ValidatedPlaceModel.get_validator().supported)
+        self.assertTrue(PlaceModel.get_validator().supported)
+
+
+if __name__ == "__main__":
+    unittest.main()
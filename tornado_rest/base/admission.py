@@ -0,0 +1,127 @@
+import logging
+from collections import deque
+from datetime import timedelta
+from tornado import ioloop
+from tornado.concurrent import Future
+from .deadline import DeadlineExceeded
+
+l = logging.getLogger(__name__)
+
+_gates = {}
+
+
+class Overloaded(Exception):
+    pass
+
+
+class AdmissionGate(object):
+    """
+    Bounds the amount of work running concurrently.
+    Up to `max_in_flight` callers are admitted at once, up to `max_queue`
+    more wait for a free slot at most `timeout` seconds, the rest are
+    rejected with `Overloaded` immediately.
+
+    Example:
+        gate = get_gate("users", 50, max_queue=100, timeout=2)
+        yield gate.acquire()
+        try:
+            result = yield motor.Op(db.users.find_one, query)
+        finally:
+            gate.release()
+    """
+
+    def __init__(self, name, max_in_flight, max_queue=0, timeout=1):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+        self._waiters = deque()
+
+    @property
+    def queue_depth(self):
+        return len(self._waiters)
+
+    def acquire(self, deadline=None):
+        """
+        Returns Future resolved once a slot is taken. Waiting for a slot
+        fails with `Overloaded` after `timeout` seconds, or with
+        `DeadlineExceeded` if the `deadline` is over before that.
+        """
+        future = Future()
+        if self.in_flight < self.max_in_flight:
+            self.in_flight += 1
+            self.admitted += 1
+            future.set_result(None)
+        elif len(self._waiters) >= self.max_queue:
+            self.shed += 1
+            future.set_exception(Overloaded(self.name))
+        else:
+            self._waiters.append(future)
+            wait, error = self.timeout, None
+            if deadline is not None and deadline.remaining() < wait:
+                wait, error = max(0, deadline.remaining()), DeadlineExceeded()
+            io_loop = ioloop.IOLoop.current()
+            handle = io_loop.add_timeout(
+                timedelta(seconds=wait),
+                lambda: self._expire(future, error))
+            future.add_done_callback(
+                lambda f: io_loop.remove_timeout(handle))
+        return future
+
+    def release(self):
+        # The slot is handed over to the oldest waiter, so `in_flight`
+        # only goes down when nobody is queued.
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.admitted += 1
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _expire(self, future, error=None):
+        if future.done():
+            return
+        try:
+            self._waiters.remove(future)
+        except ValueError:
+            pass
+        if error is not None:
+            future.set_exception(error)
+            return
+        self.shed += 1
+        self.timed_out += 1
+        l.warning("'{0}' queue wait exceeded {1} seconds, request is shed"
+                  .format(self.name, self.timeout))
+        future.set_exception(Overloaded(self.name))
+
+    def stats(self):
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+        }
+
+
+def get_gate(name, max_in_flight, max_queue=0, timeout=1):
+    """
+    Returns the process wide gate registered under `name`,
+    creating it on first use.
+    """
+    gate = _gates.get(name)
+    if gate is None:
+        gate = AdmissionGate(name, max_in_flight, max_queue, timeout)
+        _gates[name] = gate
+    return gate
+
+
+def stats():
+    return dict((name, gate.stats()) for name, gate in _gates.items())
@@ -0,0 +1,143 @@
+import logging
+import random
+from tornado import gen
+
+l = logging.getLogger(__name__)
+
+RANGE_OPERATORS = ('$lt', '$lte', '$gt', '$gte', '$in', '$nin', '$ne')
+
+
+def query_shape(query, sort=None, fields=None):
+    """
+    Returns hashable shape of a query: filtered fields with the kind of
+    condition, sort keys and projected fields, without the values.
+    """
+    filters = []
+    for field, value in (query or {}).items():
+        kind = 'eq'
+        if isinstance(value, dict) and \
+                any(op in value for op in RANGE_OPERATORS):
+            kind = 'range'
+        filters.append((field, kind))
+    return (
+        tuple(sorted(filters)),
+        tuple((field, _hashable(direction))
+              for field, direction in sort or ()),
+        tuple(sorted((field, _hashable(value))
+                     for field, value in (fields or {}).items())),
+    )
+
+
+def _hashable(value):
+    return str(value) if isinstance(value, dict) else value
+
+
+def suggest_index(shape):
+    """
+    Suggests index for the shape: equality fields first, then sort keys,
+    then range fields.
+    """
+    filters, sort, _ = shape
+    keys = [(field, 1) for field, kind in filters if kind == 'eq']
+    for field, direction in sort:
+        if field not in [key[0] for key in keys]:
+            keys.append((field, direction))
+    for field, kind in filters:
+        if kind == 'range' and field not in [key[0] for key in keys]:
+            keys.append((field, 1))
+    return keys
+
+
+def _iter_stages(plan):
+    while plan:
+        yield plan
+        stages = plan.get('inputStages') or []
+        for stage in stages[1:]:
+            for sub_stage in _iter_stages(stage):
+                yield sub_stage
+        plan = plan.get('inputStage') or (stages[0] if stages else None)
+
+
+def plan_problems(explain):
+    """
+    Returns list of problems found in `explain` output of both the legacy
+    (`cursor: BasicCursor`) and the query planner formats.
+    """
+    problems = []
+    if 'queryPlanner' in explain:
+        stages = [stage.get('stage') for stage in
+                  _iter_stages(explain['queryPlanner'].get('winningPlan'))]
+        if 'COLLSCAN' in stages:
+            problems.append('collection scan')
+        if 'SORT' in stages:
+            problems.append('in memory sort')
+    else:
+        if explain.get('cursor', '').startswith('BasicCursor'):
+            problems.append('collection scan')
+        if explain.get('scanAndOrder'):
+            problems.append('in memory sort')
+    return problems
+
+
+class IndexAdvisor(object):
+    """
+    Collects shapes of queries built by the mixins and keeps the slow ones
+    for `report`, which explains them and suggests missing indexes.
+    Enabled with the `index_advisor` application setting:
+
+        Application(urls, db=db, index_advisor=IndexAdvisor(slow_ms=100))
+    """
+
+    def __init__(self, slow_ms=100, sample_rate=1.0, max_shapes=1000):
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.max_shapes = max_shapes
+        self.shapes = {}
+
+    def observe(self, model, query, sort, fields, elapsed_ms):
+        if elapsed_ms < self.slow_ms:
+            return
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        key = (model, query_shape(query, sort, fields))
+        entry = self.shapes.get(key)
+        if entry is None:
+            if len(self.shapes) >= self.max_shapes:
+                return
+            entry = self.shapes[key] = {
+                "query": query, "sort": sort, "fields": fields,
+                "count": 0, "total_ms": 0, "max_ms": 0,
+            }
+        entry["count"] += 1
+        entry["total_ms"] += elapsed_ms
+        entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+
+    @gen.coroutine
+    def report(self, db):
+        """
+        Explains recorded slow queries and returns the ones which are not
+        served by an index, slowest first.
+        """
+        result = []
+        for (model, shape), entry in list(self.shapes.items()):
+            cursor = model.get_cursor(
+                db, entry["query"], fields=entry["fields"])
+            if entry["sort"]:
+                cursor = cursor.sort(entry["sort"])
+            explain = yield model.run_op(cursor.explain)
+            problems = plan_problems(explain)
+            if not problems:
+                continue
+            result.append({
+                "collection": model.get_collection(),
+                "filter": [field for field, _ in shape[0]],
+                "sort": list(shape[1]),
+                "fields": [field for field, _ in shape[2]],
+                "count": entry["count"],
+                "avg_ms": entry["total_ms"] / entry["count"],
+                "max_ms": entry["max_ms"],
+                "problems": problems,
+                "suggested_index": suggest_index(shape),
+            })
+        result.sort(key=lambda item: item["max_ms"], reverse=True)
+        raise gen.Return(result)
@@ -0,0 +1,85 @@
+import time
+from collections import OrderedDict
+
+_caches = {}
+
+
+class TTLCache(object):
+    """
+    Small in process cache with expiration and LRU eviction. Entries may
+    be tagged with the collection and the document they were computed
+    from, so they can be evicted when the collection changes.
+
+    Example:
+        cache = get_cache("places.aggregate", ttl=10)
+        result = cache.get(key)
+        if result is None:
+            result = yield PlaceModel.aggregate_list(db, pipeline)
+            cache.set(key, result, "places")
+    """
+
+    def __init__(self, name, ttl, max_size=1000):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self._entries.pop(key, None)
+        if entry is None or entry[0] < time.time():
+            self.misses += 1
+            return default
+        self._entries[key] = entry
+        self.hits += 1
+        return entry[2]
+
+    def set(self, key, value, collection=None, _id=None):
+        self._entries.pop(key, None)
+        while len(self._entries) >= self.max_size:
+            self._entries.popitem(last=False)
+        self._entries[key] = (
+            time.time() + self.ttl, (collection, _id), value)
+
+    def invalidate(self, collection, _id=None):
+        """
+        Evicts entries of the collection. If `_id` is given, entries
+        tagged with another document are kept.
+        """
+        for key, entry in list(self._entries.items()):
+            entry_collection, entry_id = entry[1]
+            if entry_collection != collection:
+                continue
+            if _id is None or entry_id is None or entry_id == _id:
+                del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def get_cache(name, ttl, max_size=1000):
+    """
+    Returns the process wide cache registered under `name`,
+    creating it on first use.
+    """
+    cache = _caches.get(name)
+    if cache is None:
+        cache = _caches[name] = TTLCache(name, ttl, max_size)
+    return cache
+
+
+def invalidate(collection, _id=None):
+    """
+    Evicts entries computed from the collection, or from the document
+    of the collection, from all caches.
+    """
+    for cache in _caches.values():
+        cache.invalidate(collection, _id)
@@ -0,0 +1,154 @@
+import atexit
+import json
+import logging
+import random
+import threading
+import time
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+l = logging.getLogger(__name__)
+
+SENSITIVE = ('password', 'token', 'secret', 'key', 'auth', 'session')
+MASK = '***'
+_STOP = object()
+
+
+def is_sensitive(name, sensitive):
+    name = name.lower()
+    return any(word in name for word in sensitive)
+
+
+def sanitize(value, sensitive=SENSITIVE):
+    """
+    Masks values of keys which look like credentials, at any depth.
+    """
+    if isinstance(value, dict):
+        return dict(
+            (key, MASK if is_sensitive(key, sensitive)
+             else sanitize(item, sensitive))
+            for key, item in value.items())
+    if isinstance(value, list):
+        return [sanitize(item, sensitive) for item in value]
+    return value
+
+
+def decode(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return value
+
+
+class TrafficRecorder(object):
+    """
+    Appends a `sample_rate` share of requests to `BaseHandler` as JSON
+    lines to `path`, for replay with `tornado_rest.libs.replay`. Query
+    arguments and JSON bodies are kept with credential-like keys masked,
+    other bodies and headers are not recorded. Enabled with the
+    `traffic_recorder` application setting:
+
+        Application(urls, db=db,
+                    traffic_recorder=TrafficRecorder("/tmp/traffic.jsonl"))
+
+    Lines are appended by a writer thread, in batches of `flush_every` or
+    at least every `flush_interval` seconds, so requests never wait for
+    the file. The thread starts with the first recorded request, after
+    the server processes are forked, and lines left are written when
+    the process exits.
+    """
+
+    def __init__(self, path, sample_rate=1.0, sensitive=SENSITIVE,
+                 max_body=64 * 1024, flush_every=100, flush_interval=1):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.sensitive = sensitive
+        self.max_body = max_body
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._queue = Queue()
+        self._writer = None
+        atexit.register(self.close)
+
+    def record(self, handler):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        request = handler.request
+        arguments = dict(
+            (name, [MASK] if is_sensitive(name, self.sensitive)
+             else [decode(value) for value in values])
+            for name, values in request.arguments.items())
+        entry = {
+            "started": request._start_time,
+            "method": request.method,
+            "path": request.path,
+            "arguments": arguments,
+            "route": handler.__class__.__name__,
+            "status": handler.get_status(),
+            "duration_ms": request.request_time() * 1000,
+        }
+        body = self.get_body(request)
+        if body is not None:
+            entry["body"] = body
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_lines)
+            self._writer.daemon = True
+            self._writer.start()
+        self._queue.put(json.dumps(entry, default=str))
+
+    def get_body(self, request):
+        if not request.body or len(request.body) > self.max_body:
+            return None
+        try:
+            return sanitize(json.loads(decode(request.body)), self.sensitive)
+        except ValueError:
+            return None
+
+    def flush(self):
+        """
+        Waits until lines recorded so far are written.
+        """
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self):
+        """
+        Writes lines left and stops the writer thread.
+        """
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(_STOP)
+            writer.join()
+
+    def _write_lines(self):
+        stopped = False
+        while not stopped:
+            lines = []
+            item = self._queue.get()
+            flush_at = time.time() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stopped = True
+                    break
+                lines.append(item)
+                timeout = flush_at - time.time()
+                if len(lines) >= self.flush_every or timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except Empty:
+                    break
+            self._write(lines)
+            for _ in range(len(lines) + stopped):
+                self._queue.task_done()
+
+    def _write(self, lines):
+        if not lines:
+            return
+        try:
+            with open(self.path, 'a') as f:
+                f.write('\n'.join(lines) + '\n')
+        except IOError:
+            l.exception("Traffic is not written to {0}".format(self.path))
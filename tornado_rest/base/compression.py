@@ -0,0 +1,90 @@
+import zlib
+from tornado.escape import utf8
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def gzip_compress(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def brotli_compress(data, level):
+    return brotli.compress(data, quality=min(level, 11))
+
+
+def zstd_compress(data, level):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+# supported encodings in order of preference, brotli and zstd are used
+# when their packages are installed
+COMPRESSORS = [(name, compress) for name, compress, available in (
+    ("br", brotli_compress, brotli is not None),
+    ("zstd", zstd_compress, zstandard is not None),
+    ("gzip", gzip_compress, True),
+) if available]
+
+
+def parse_accept_encoding(header):
+    accepted = {}
+    for part in header.split(","):
+        params = part.strip().split(";")
+        name = params[0].strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params[1:]:
+            key, _, value = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def negotiate(header):
+    """
+    Returns the supported encoding the client prefers, by `q` value and
+    then by our preference, or None.
+    """
+    if not header:
+        return None
+    accepted = parse_accept_encoding(header)
+    best, best_quality = None, 0
+    for name, _ in COMPRESSORS:
+        quality = accepted.get(name, accepted.get("*", 0))
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+class CompressedBody(object):
+    """
+    Encoded response body which keeps its compressed forms, so a body
+    kept in a cache is compressed once per encoding.
+    """
+
+    def __init__(self, body):
+        self.body = utf8(body)
+        self._encoded = {}
+
+    def __len__(self):
+        return len(self.body)
+
+    def encode(self, encoding, level=6):
+        data = self._encoded.get(encoding)
+        if data is None:
+            data = self._encoded[encoding] = \
+                dict(COMPRESSORS)[encoding](self.body, level)
+        return data
@@ -0,0 +1,59 @@
+import time
+from pymongo.cursor import Cursor
+
+try:
+    from pymongo.errors import ExecutionTimeout
+except ImportError:
+    class ExecutionTimeout(Exception):
+        """
+        Not raised by pymongo < 2.7, which has no server side time limits.
+        """
+
+# `max_time_ms` and `maxTimeMS` need pymongo >= 2.7 (motor >= 0.2), with
+# older drivers deadlines only stop retries and waiting for the gates
+SERVER_TIME_LIMITS = hasattr(Cursor, 'max_time_ms')
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline(object):
+    """
+    Point in time after which the result of a request is of no use.
+    It is passed to `BaseModel` methods, which limit server side
+    execution with `max_time_ms` where the driver supports it and stop
+    retrying once it is over.
+
+    Example:
+        deadline = Deadline(2.5)
+        obj = yield ExampleModel.find_one(db, {"i": 3}, deadline=deadline)
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.expires_at = time.time() + timeout
+
+    def remaining(self):
+        return self.expires_at - time.time()
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self):
+        if self.expired:
+            raise DeadlineExceeded()
+
+    def max_time_ms(self):
+        self.check()
+        return max(1, int(self.remaining() * 1000))
+
+    def limit(self, cursor):
+        """
+        Limits server side execution time of the cursor to the remaining
+        time, if the driver supports it.
+        """
+        if SERVER_TIME_LIMITS:
+            cursor = cursor.max_time_ms(self.max_time_ms())
+        return cursor
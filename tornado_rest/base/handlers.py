@@ -1,14 +1,30 @@
 __author__ = 'indieman'
 
 import json
+import time
+import logging
+from datetime import datetime, date
+from tornado import web
 from tornado.web import RequestHandler, HTTPError
 from bson import ObjectId
 from bson.errors import InvalidId
 
 from tornado import gen
+from tornado.concurrent import Future
+from tornado.stack_context import StackContext
 
 from schematics.exceptions import ValidationError, ModelConversionError
-from .models import BaseModel, OnlyIdModel
+from schematics.types.compound import ListType
+from .models import BaseModel, OnlyIdModel, MAX_FIND_LIST_LEN
+from . import admission
+from .cache import get_cache
+from .compression import CompressedBody, negotiate
+from .ingest import RecordParser, RecordParseError
+from .admission import Overloaded
+from .deadline import Deadline, DeadlineExceeded
+from .query import QuerySpec, InvalidQuery, near_fields
+
+l = logging.getLogger(__name__)
 
 
 class UnknownNestedResource(Exception):
@@ -29,6 +45,8 @@ class JSONEncoder(json.JSONEncoder):
             return str(o)
         if isinstance(o, BaseModel):
             return o.to_json()
+        if isinstance(o, (datetime, date)):
+            return o.isoformat()
         return json.JSONEncoder.default(self, o)
 
 
@@ -56,35 +74,89 @@ class SimpleHandler(RequestHandler):
     data = None
     model = None
     db = None
-
-    _filter = {}
-    _fields = {}
-    _query = {}
-    _sort = [("_id", 1), ]
-    _limit = 20
-    _skip = 0
-
-    def get_cursor(self, model=None):
-        if not model:
-            self._cursor = self.model.get_cursor(
-                self.db,
-                query=self._query,
-                fields=self._fields
-            ).sort(self._sort).skip(self._skip).limit(self._limit)
-        else:
-            self._cursor = model.get_cursor(
-                self.db,
-                query=self._query,
-                fields=self._fields
-            ).sort(self._sort).skip(self._skip).limit(self._limit)
-
-        return self._cursor
+    deadline = None
+    query_spec = None
+
+    # 'model' builds a model instance for every document read, 'record'
+    # a read-only `__slots__` record of the model, 'raw' renders documents
+    # as they come from mongo, projected to the fields visible in the
+    # model.
+    read_mode = 'model'
+
+    retry_after = 1
+
+    # Responses of at least `compress_min_size` bytes are compressed with
+    # the encoding negotiated from Accept-Encoding, None disables it.
+    compress_min_size = 1024
+    compress_level = 6
+
+    def build_query_spec(self, spec):
+        """
+        Mixins extend the spec and pass it on with super().
+        """
+        return spec
+
+    def get_query_model(self):
+        """
+        Returns model the request query refers to.
+        """
+        return self.model
+
+    def get_cursor(self, model=None, spec=None):
+        """
+        Creates cursor for the request query spec. Cursors are created
+        only by handlers which read, on demand.
+        """
+        model = model or self.model
+        spec = spec or self.query_spec
+        if self.read_mode == 'raw':
+            spec = spec.project(self.get_read_projection(model))
+        return spec.get_cursor(self.db, model, self.deadline)
+
+    def get_read_projection(self, model):
+        """
+        Returns projection to fetch documents of the model with, if the read
+        mode or the request needs one.
+        """
+        spec = self.query_spec
+        if self.read_mode == 'raw':
+            projection = model.raw_projection(spec.fields)
+            for name in spec.meta_fields():
+                projection[name] = spec.fields[name]
+            return projection
+        return dict(spec.fields) if spec and spec.fields else None
+
+    def read_as_model(self):
+        # projected documents and documents with computed fields are
+        # serialized by to_json without building the model
+        if self.read_mode not in ('model', 'record') or \
+                (self.query_spec and self.query_spec.fields):
+            return False
+        return True if self.read_mode == 'model' else 'record'
+
+    def to_json(self, model, object):
+        if self.read_mode == 'raw':
+            return model.raw_to_json(object)
+        if isinstance(object, dict):
+            spec = self.query_spec
+            data = model.get_serializer(spec.fields).to_json(object)
+            for name in spec.meta_fields():
+                if name in object:
+                    data[name] = object[name]
+            return data
+        return object.to_json()
 
     def initialize(self, **kwargs):
         super(SimpleHandler, self).initialize(**kwargs)
         self.db = self.settings["db"]
 
     def write_error(self, code, message="Error", errors=[], **kwargs):
+        exc_info = kwargs.get("exc_info")
+        if exc_info and isinstance(exc_info[1], Overloaded):
+            code, message = 503, "Service Unavailable"
+            self.set_header("Retry-After", self.retry_after)
+        elif exc_info and isinstance(exc_info[1], DeadlineExceeded):
+            code, message = 504, "Gateway Timeout"
         result = {
             "code": code,
             "message": message,
@@ -93,12 +165,44 @@ class SimpleHandler(RequestHandler):
         self._status_code = code
         self.finish(JSONEncoder().encode(result))
 
+    def observe_query(self, model, elapsed_ms):
+        advisor = self.settings.get("index_advisor")
+        if advisor is not None:
+            spec = self.query_spec
+            advisor.observe(
+                model, spec.query, spec.sort, spec.fields, elapsed_ms)
+
     def render(self, data, **kwargs):
 
-        self.finish(JSONEncoder().encode(data))
+        self.render_body(CompressedBody(JSONEncoder().encode(data)))
+
+    def render_body(self, body):
+        """
+        Finishes with `CompressedBody`, compressed if it is large enough
+        and the client accepts one of the supported encodings.
+        """
+        min_size = self.compress_min_size
+        if min_size is None or len(body) < min_size:
+            self.finish(body.body)
+            return
+        self.add_header("Vary", "Accept-Encoding")
+        encoding = negotiate(self.request.headers.get("Accept-Encoding"))
+        if encoding is None:
+            self.finish(body.body)
+            return
+        self.set_header("Content-Encoding", encoding)
+        self.finish(body.encode(encoding, self.compress_level))
 
     def prepare(self):
-        self.get_cursor()
+        try:
+            spec = self.build_query_spec(QuerySpec())
+            model = self.get_query_model()
+            if model is not None:
+                spec.validate(model)
+        except InvalidQuery as e:
+            self.write_error(400, "Bad Request", e.errors)
+        else:
+            self.query_spec = spec
 
 
 class BaseHandler(SimpleHandler):
@@ -108,6 +212,117 @@ class BaseHandler(SimpleHandler):
 
     allowed_methods = []
 
+    # Admission control: at most `max_in_flight` requests of the handler
+    # class are served at once, `max_queued` more wait up to
+    # `queue_timeout` seconds, everything else gets 503 with Retry-After.
+    max_in_flight = None
+    max_queued = 0
+    queue_timeout = 1
+    _admission_gate = None
+
+    # Request deadline in seconds, clients may ask for another value with
+    # the `X-Request-Timeout` header, limited by `max_request_timeout` or,
+    # if it is not set, by `request_timeout`.
+    request_timeout = None
+    max_request_timeout = None
+
+    _profile = None
+
+    # Payloads of `post` and `put` are checked with the compiled validator
+    # of the model against the plain dict, set to True to build and
+    # validate the model instead.
+    build_models = False
+
+    def get_request_timeout(self):
+        """
+        Returns the deadline of the request in seconds or None, raises
+        `ValueError` if `X-Request-Timeout` is not a positive number.
+        """
+        timeout = self.request_timeout
+        header = self.request.headers.get("X-Request-Timeout")
+        if header:
+            try:
+                timeout = float(header)
+            except ValueError:
+                timeout = None
+            # nan fails both comparisons
+            if timeout is None or not 0 < timeout < float("inf"):
+                raise ValueError(
+                    "X-Request-Timeout must be a positive number of seconds")
+            limit = self.max_request_timeout or self.request_timeout
+            if limit:
+                timeout = min(timeout, limit)
+        return timeout
+
+    def get_validator(self):
+        """
+        Returns `FastValidator` for payloads of the model, or None if the
+        model has to be built.
+        """
+        if self.build_models:
+            return None
+        validator = self.model.get_validator()
+        return validator if validator.supported else None
+
+    def get_admission_gate(self):
+        if not self.max_in_flight:
+            return None
+        cls = self.__class__
+        return admission.get_gate(
+            'handler.{0}.{1}'.format(cls.__module__, cls.__name__),
+            self.max_in_flight, self.max_queued, self.queue_timeout)
+
+    @gen.coroutine
+    def prepare(self):
+        try:
+            timeout = self.get_request_timeout()
+        except ValueError as e:
+            self.write_error(400, "Bad Request", [str(e)])
+            return
+        if timeout:
+            self.deadline = Deadline(timeout)
+        gate = self.get_admission_gate()
+        if gate is not None:
+            try:
+                yield gate.acquire(self.deadline)
+            except Overloaded:
+                self.set_header("Retry-After", self.retry_after)
+                self.write_error(503, "Service Unavailable", [])
+                return
+            except DeadlineExceeded:
+                self.write_error(504, "Gateway Timeout", [])
+                return
+            self._admission_gate = gate
+        if self.deadline is not None and self.deadline.expired:
+            self.write_error(504, "Gateway Timeout", [])
+            return
+        super(BaseHandler, self).prepare()
+
+    def _execute(self, transforms, *args, **kwargs):
+        profiler = self.settings.get("profiler")
+        if profiler is None or not profiler.wants(self.request):
+            return super(BaseHandler, self)._execute(
+                transforms, *args, **kwargs)
+        # callbacks of the request, including the ones resuming coroutines
+        # after motor operations, run with the profile enabled
+        self._profile = profiler.start(
+            self.request, self.__class__.__name__)
+        with StackContext(self._profile.active):
+            return super(BaseHandler, self)._execute(
+                transforms, *args, **kwargs)
+
+    def on_finish(self):
+        if self._admission_gate is not None:
+            self._admission_gate.release()
+            self._admission_gate = None
+        if self._profile is not None:
+            self.settings["profiler"].finish(self._profile)
+            self._profile = None
+        recorder = self.settings.get("traffic_recorder")
+        if recorder is not None:
+            recorder.record(self)
+        super(BaseHandler, self).on_finish()
+
     def options(self, *args, **kwargs):
         allowed_methods = ",".join([method.upper() for method in self.allowed_methods])
         self.add_header("Allow", allowed_methods)
@@ -128,6 +343,30 @@ class BaseHandler(SimpleHandler):
     def delete(self, *args, **kwargs):
         pass
 
+    @gen.coroutine
+    def call_hook(self, hook):
+        """
+        Calls `pre_*` hook, waiting for it if it is a coroutine.
+        """
+        result = hook()
+        if isinstance(result, Future):
+            yield result
+
+    @gen.coroutine
+    def find_object_and_nested(self, pk, nested, nested_id):
+        """
+        Fetches the object and its nested object concurrently.
+        Raises ObjectDoesNotExist if either of them is missing.
+        """
+        nested_field = getattr(self.model, nested, None)
+        object, nested_object = yield BaseModel.find_one_each(self.db, [
+            (self.model, {"_id": ObjectId(pk.decode("utf-8"))}),
+            (nested_field.model, {"_id": nested_id}),
+        ], deadline=self.deadline)
+        if not object or not nested_object:
+            raise ObjectDoesNotExist()
+        raise gen.Return((object, nested_object))
+
     def pre_get(self):
         pass
 
@@ -166,12 +405,15 @@ class BaseOneHandler(BaseHandler):
     @gen.coroutine
     @is_allow
     def get(self, pk, *args, **kwargs):
-        self.pre_get()
+        yield self.call_hook(self.pre_get)
 
         try:
             object = yield self.model.find_one(
                 self.db,
-                {"_id": ObjectId(pk.decode("utf-8"))}
+                {"_id": ObjectId(pk.decode("utf-8"))},
+                model=self.read_as_model(),
+                deadline=self.deadline,
+                fields=self.get_read_projection(self.model)
             )
 
             if not object:
@@ -182,19 +424,20 @@ class BaseOneHandler(BaseHandler):
         except InvalidId:
             self.write_error(404, "Invalid id", [])
         else:
-            self.render(object)
+            self.render(self.to_json(self.model, object))
 
         self.post_get()
 
     @gen.coroutine
     @is_allow
     def patch(self, pk, *args, **kwargs):
-        self.pre_patch()
+        yield self.call_hook(self.pre_patch)
 
         try:
             object = yield self.model.find_one(
                 self.db,
-                {"_id": ObjectId(pk.decode("utf-8"))}
+                {"_id": ObjectId(pk.decode("utf-8"))},
+                deadline=self.deadline
             )
 
             if not object:
@@ -207,7 +450,7 @@ class BaseOneHandler(BaseHandler):
 
             object.validate()
 
-            yield object.update(self.db)
+            yield object.update(self.db, deadline=self.deadline)
         except InvalidId:
             self.write_error(404, "Invalid id", [])
         except (ModelConversionError, ValidationError) as e:
@@ -223,24 +466,35 @@ class BaseOneHandler(BaseHandler):
     @gen.coroutine
     @is_allow
     def put(self, pk, *args, **kwargs):
-        self.pre_put()
+        yield self.call_hook(self.pre_put)
         try:
             raw_data = json.loads(self.request.body)
+            _id = ObjectId(pk.decode("utf-8"))
 
             object = yield self.model.find_one(
                 self.db,
-                {"_id": ObjectId(pk.decode("utf-8"))}
+                {"_id": _id},
+                model=False,
+                deadline=self.deadline,
+                fields={"_id": 1}
             )
 
             if not object:
                 raise ObjectDoesNotExist()
 
-            object = self.model(raw_data)
-
-            object._id = ObjectId(pk.decode("utf-8"))
-
-            object.validate(strict=True)
-            yield object.update(self.db)
+            validator = self.get_validator()
+            if validator is not None:
+                data = validator.validate(raw_data)
+                data.pop("_id", None)
+                yield self.model.update_document(
+                    self.db, {"_id": _id}, data, deadline=self.deadline)
+                data["_id"] = _id
+            else:
+                object = self.model(raw_data)
+                object._id = _id
+                object.validate(strict=True)
+                yield object.update(self.db, deadline=self.deadline)
+                data = object.to_primitive()
 
         except (ModelConversionError, ValidationError) as e:
             self.write_error(422, "Validation Failed", [e.message])
@@ -251,24 +505,25 @@ class BaseOneHandler(BaseHandler):
         except ObjectDoesNotExist:
             self.write_error(404, "Object does not exist", [])
         else:
-            self.render(object.to_primitive())
+            self.render(data)
         self.post_put()
 
     @gen.coroutine
     @is_allow
     def delete(self, pk, *args, **kwargs):
-        self.pre_delete()
+        yield self.call_hook(self.pre_delete)
 
         try:
             object = yield self.model.find_one(
                 self.db,
-                {"_id": ObjectId(pk.decode("utf-8"))}
+                {"_id": ObjectId(pk.decode("utf-8"))},
+                deadline=self.deadline
             )
 
             if not object:
                 raise ObjectDoesNotExist()
 
-            yield object.remove(self.db)
+            yield object.remove(self.db, deadline=self.deadline)
         except InvalidId:
             self.write_error(404, "Invalid id", [])
         except ObjectDoesNotExist:
@@ -284,10 +539,14 @@ class BaseManyHandler(BaseHandler):
     @gen.coroutine
     @is_allow
     def get(self, *args, **kwargs):
-        self.pre_get()
+        yield self.call_hook(self.pre_get)
 
-        objects = yield self.model.find(self._cursor)
-        objects = map(lambda item: item.to_json(), objects)
+        started = time.time()
+        objects = yield self.model.find(
+            self.get_cursor(), model=self.read_as_model(),
+            deadline=self.deadline)
+        self.observe_query(self.model, (time.time() - started) * 1000)
+        objects = [self.to_json(self.model, item) for item in objects]
 
         self.render(objects)
         self.post_get()
@@ -295,19 +554,29 @@ class BaseManyHandler(BaseHandler):
     @gen.coroutine
     @is_allow
     def post(self, *args, **kwargs):
-        self.pre_post()
+        yield self.call_hook(self.pre_post)
 
+        object = None
         try:
             raw_data = json.loads(self.request.body)
-            object = self.model(raw_data)
-            object.validate(strict=True)
+            validator = self.get_validator()
+            if validator is not None:
+                data = validator.validate(raw_data)
+            else:
+                object = self.model(raw_data)
+                object.validate(strict=True)
         except (ModelConversionError, ValidationError) as e:
             self.write_error(422, "Validation Failed", [e.message])
         except ValueError:
             self.write_error(400, "Bad Request", [])
         else:
-            yield object.insert(self.db)
-            self.render(object.to_primitive())
+            if object is None:
+                data["_id"] = yield self.model.insert_document(
+                    self.db, data, deadline=self.deadline)
+                self.render(data)
+            else:
+                yield object.insert(self.db, deadline=self.deadline)
+                self.render(object.to_primitive())
 
         self.post_post()
 
@@ -315,9 +584,10 @@ class BaseManyHandler(BaseHandler):
     @is_allow
     def head(self, *args, **kwargs):
 
-        count = yield self.model.count(self._cursor)
+        count = yield self.model.count(
+            self.get_cursor(), deadline=self.deadline)
 
-        self.add_header("X-Count-Per-Page", self._limit)
+        self.add_header("X-Count-Per-Page", self.query_spec.limit)
         self.add_header("X-Total-Items", count)
 
         self.finish()
@@ -330,7 +600,7 @@ class BaseNestedOneHandler(BaseHandler):
     @gen.coroutine
     @is_allow
     def get(self, pk, nested, nested_pk, *args, **kwargs):
-        self.pre_get()
+        yield self.call_hook(self.pre_get)
 
         try:
             if nested not in self.model.references():
@@ -340,7 +610,10 @@ class BaseNestedOneHandler(BaseHandler):
 
             object = yield nested_field.model.find_one(
                 self.db,
-                {"_id": ObjectId(nested_pk.decode("utf-8"))}
+                {"_id": ObjectId(nested_pk.decode("utf-8"))},
+                model=self.read_as_model(),
+                deadline=self.deadline,
+                fields=self.get_read_projection(nested_field.model)
             )
             if not object:
                 raise ObjectDoesNotExist()
@@ -352,7 +625,7 @@ class BaseNestedOneHandler(BaseHandler):
         except ObjectDoesNotExist:
             self.write_error(404, "Object does not exist", [])
         else:
-            self.render(object)
+            self.render(self.to_json(nested_field.model, object))
 
         self.post_get()
 
@@ -364,28 +637,14 @@ class BaseNestedOneHandler(BaseHandler):
             if nested not in self.model.references():
                 raise UnknownNestedResource()
 
-            nested_field = getattr(self.model, nested, None)
-            nested_object = yield nested_field.model.find_one(
-                self.db,
-                {"_id": ObjectId(nested_pk.decode("utf-8"))}
-            )
-
-            if not nested_object:
-                raise ObjectDoesNotExist()
-
-            object = yield self.model.find_one(
-                self.db,
-                {"_id": ObjectId(pk.decode("utf-8"))}
-            )
-
-            if not object:
-                raise ObjectDoesNotExist()
+            object, nested_object = yield self.find_object_and_nested(
+                pk, nested, ObjectId(nested_pk.decode("utf-8")))
 
             nested_list = getattr(object, nested)
             nested_list.append(nested_object._id)
             setattr(object, nested, list(set(nested_list)))
 
-            yield object.update(self.db)
+            yield object.update(self.db, deadline=self.deadline)
         except UnknownNestedResource:
             self.write_error(404, "Unknown nested resource", [])
         except InvalidId:
@@ -412,21 +671,8 @@ class BaseNestedOneHandler(BaseHandler):
             new_el = ObjectId(raw_data["_id"].decode("utf-8"))
             old_el = ObjectId(nested_pk.decode("utf-8"))
 
-            nested_field = getattr(self.model, nested, None)
-            nested_object = yield nested_field.model.find_one(
-                self.db,
-                {"_id": new_el}
-            )
-
-            if not nested_object:
-                raise ObjectDoesNotExist()
-
-            object = yield self.model.find_one(
-                self.db,
-                {"_id": ObjectId(pk.decode("utf-8"))}
-            )
-            if not object:
-                raise ObjectDoesNotExist()
+            object, nested_object = yield self.find_object_and_nested(
+                pk, nested, new_el)
 
             nested_list = getattr(object, nested)
 
@@ -437,7 +683,7 @@ class BaseNestedOneHandler(BaseHandler):
             nested_list.append(new_el)
 
             setattr(object, nested, list(set(nested_list)))
-            yield object.update(self.db)
+            yield object.update(self.db, deadline=self.deadline)
         except (ValidationError, ModelConversionError) as e:
             self.write_error(422, "Validation Failed", [e.messages])
         except UnknownNestedResource:
@@ -459,28 +705,13 @@ class BaseNestedOneHandler(BaseHandler):
             if nested not in self.model.references():
                 raise UnknownNestedResource()
 
-            nested_field = getattr(self.model, nested, None)
-
-            nested_object = yield nested_field.model.find_one(
-                self.db,
-                {"_id": ObjectId(nested_pk.decode("utf-8"))}
-            )
-
-            if not nested_object:
-                raise ObjectDoesNotExist()
-
-            object = yield self.model.find_one(
-                self.db,
-                {"_id": ObjectId(pk.decode("utf-8"))}
-            )
-
-            if not object:
-                raise ObjectDoesNotExist()
+            object, nested_object = yield self.find_object_and_nested(
+                pk, nested, ObjectId(nested_pk.decode("utf-8")))
 
             nested_list = getattr(object, nested)
             nested_list.remove(nested_object._id)
             setattr(object, nested, nested_list)
-            yield object.update(self.db)
+            yield object.update(self.db, deadline=self.deadline)
 
         except UnknownNestedResource:
             self.write_error(404, "Unknown nested resource", [])
@@ -493,33 +724,111 @@ class BaseNestedOneHandler(BaseHandler):
 
 
 class BaseNestedManyHandler(BaseHandler):
+    """
+    Lists objects referenced by the object. Without filters and `$sort`
+    only the requested page of the reference array is fetched with
+    `$slice` and objects follow the order of the array, otherwise the
+    whole array of ids is fetched and filters, sort and pagination are
+    applied by the nested query.
+    """
 
     allowed_methods = ["options", "head", "get", "post"]
 
+    def get_query_model(self):
+        nested = self.path_kwargs.get("nested")
+        if nested is None and len(self.path_args) > 1:
+            nested = self.path_args[1]
+        if nested in self.model.references():
+            return getattr(self.model, nested).model
+        return self.model
+
+    def nested_query(self, query, nested_ids):
+        ids_query = {"_id": {"$in": nested_ids}}
+        if "_id" in query:
+            return {"$and": [query, ids_query]}
+        query = dict(query)
+        query.update(ids_query)
+        return query
+
+    @staticmethod
+    def order_by_ids(objects, ids):
+        """
+        Sorts found objects in the order of their ids in the array.
+        """
+        position = {}
+        for i, _id in enumerate(ids):
+            position.setdefault(_id, i)
+
+        def key(item):
+            _id = item.get("_id") if isinstance(item, dict) \
+                else getattr(item, "_id", None)
+            return position.get(_id, len(ids))
+        return sorted(objects, key=key)
+
+    @gen.coroutine
+    def find_nested_ids(self, pk, nested, page=None):
+        """
+        Fetches the reference array of the object, only the given
+        (skip, limit) page of it if `page` is set.
+        """
+        fields = {nested: {"$slice": list(page)} if page else 1}
+        main_object = yield self.model.find_one(
+            self.db,
+            {"_id": ObjectId(pk.decode("utf-8"))},
+            model=False,
+            deadline=self.deadline,
+            fields=fields
+        )
+        if not main_object:
+            raise ObjectDoesNotExist()
+        raise gen.Return(main_object.get(nested) or [])
+
+    @gen.coroutine
+    def count_nested_ids(self, pk, nested):
+        result = yield self.model.aggregate_list(self.db, [
+            {"$match": {"_id": ObjectId(pk.decode("utf-8"))}},
+            {"$project": {
+                "count": {"$size": {"$ifNull": ["$" + nested, []]}}}},
+        ], deadline=self.deadline)
+        if not result:
+            raise ObjectDoesNotExist()
+        raise gen.Return(result[0]["count"])
+
     @gen.coroutine
     @is_allow
     def get(self, pk, nested, *args, **kwargs):
-        self.pre_get()
+        yield self.call_hook(self.pre_get)
 
         try:
             if nested not in self.model.references():
                 raise UnknownNestedResource()
 
-            main_object = yield self.model.find_one(
-                self.db,
-                {"_id": ObjectId(pk.decode("utf-8"))}
-            )
-
-            nested_ids = getattr(main_object, nested, [])
-            nested_field = getattr(self.model, nested, None)
-            cursor = nested_field.model.get_cursor(self.db, {"_id": {"$in": nested_ids}})
-
-            objects = yield nested_field.model.find(cursor)
+            nested_model = getattr(self.model, nested).model
+            spec = self.query_spec
+            list_len = min(
+                spec.limit,
+                nested_model.find_list_len() or MAX_FIND_LIST_LEN)
+            in_array_order = not (spec.query or self.get_argument("$sort", ""))
+            if in_array_order:
+                nested_ids = yield self.find_nested_ids(
+                    pk, nested, (spec.skip, list_len))
+                spec = spec.paginate(0, list_len).order_by([])
+            else:
+                nested_ids = yield self.find_nested_ids(pk, nested)
+            spec = spec.where(self.nested_query(spec.query, nested_ids))
+
+            objects = yield nested_model.find(
+                self.get_cursor(nested_model, spec),
+                model=self.read_as_model(),
+                list_len=list_len,
+                deadline=self.deadline)
+            if in_array_order:
+                objects = self.order_by_ids(objects, nested_ids)
 
             if not objects:
                 raise ObjectDoesNotExist()
 
-            objects = map(lambda item: item.to_json(), objects)
+            objects = [self.to_json(nested_model, item) for item in objects]
 
         except UnknownNestedResource:
             self.write_error(404, "Unknown nested resource", [])
@@ -535,7 +844,7 @@ class BaseNestedManyHandler(BaseHandler):
     @gen.coroutine
     @is_allow
     def post(self, pk, nested, *args, **kwargs):
-        self.pre_post()
+        yield self.call_hook(self.pre_post)
 
         try:
             if nested not in self.model.references():
@@ -547,12 +856,14 @@ class BaseNestedManyHandler(BaseHandler):
             nested_object = nested_field.model(raw_data)
             nested_object.validate(strict=True)
 
-            yield nested_object.insert(self.db)
-
-            object = yield self.model.find_one(
-                self.db,
-                {"_id": ObjectId(pk.decode("utf-8"))}
-            )
+            object, _ = yield [
+                self.model.find_one(
+                    self.db,
+                    {"_id": ObjectId(pk.decode("utf-8"))},
+                    deadline=self.deadline
+                ),
+                nested_object.insert(self.db, deadline=self.deadline)
+            ]
             if not object:
                 raise ObjectDoesNotExist()
 
@@ -560,7 +871,7 @@ class BaseNestedManyHandler(BaseHandler):
             nested_list.append(nested_object._id)
             setattr(object, nested, list(set(nested_list)))
 
-            yield object.update(self.db)
+            yield object.update(self.db, deadline=self.deadline)
 
         except UnknownNestedResource:
             self.write_error(404, "Unknown resource", [])
@@ -584,19 +895,18 @@ class BaseNestedManyHandler(BaseHandler):
             if nested not in self.model.references():
                 raise UnknownNestedResource()
 
-            main_object = yield self.model.find_one(
-                self.db,
-                {"_id": ObjectId(pk.decode("utf-8"))}
-            )
-
-            if not main_object:
-                raise ObjectDoesNotExist()
-
-            nested_field = getattr(self.model, nested, None)
-
-            count = yield nested_field.model.count(self._cursor)
-
-            self.add_header("X-Count-Per-Page", self._limit)
+            spec = self.query_spec
+            if spec.query:
+                nested_model = getattr(self.model, nested).model
+                nested_ids = yield self.find_nested_ids(pk, nested)
+                spec = spec.where(self.nested_query(spec.query, nested_ids))
+                count = yield nested_model.count(
+                    self.get_cursor(nested_model, spec),
+                    deadline=self.deadline)
+            else:
+                count = yield self.count_nested_ids(pk, nested)
+
+            self.add_header("X-Count-Per-Page", self.query_spec.limit)
             self.add_header("X-Total-Items", count)
         except UnknownNestedResource:
             self.write_error(404, "Unknown nested resource", [])
@@ -607,3 +917,438 @@ class BaseNestedManyHandler(BaseHandler):
         else:
             self.finish()
 
+
+class BaseAggregateHandler(BaseHandler):
+    """
+    Computes group counts, facets, distinct values and stats of numeric
+    fields on the server. Filters of `FilterMixin` become the `$match`
+    stage, results are cached for `cache_ttl` seconds.
+
+        GET /places/stats?category=cafe&$group_by=city&$stats=rating
+        GET /places/stats?$facet=city,category
+        GET /places/stats?$distinct=city
+
+    Only fields listed in `aggregate_fields` may be grouped by, faceted
+    or made distinct, only fields in `stats_fields` may have stats.
+    """
+
+    allowed_methods = ["options", "get"]
+
+    aggregate_fields = []
+    stats_fields = []
+    max_groups = 100
+    cache_ttl = 10
+
+    def get_fields_argument(self, name, allowed):
+        value = self.get_argument(name, None)
+        if not value:
+            return []
+        fields = [''.join(field.split()) for field in value.split(',')]
+        unknown = [field for field in fields if field not in allowed]
+        if unknown:
+            raise InvalidQuery([
+                "'{0}' is not allowed in {1}".format(field, name)
+                for field in unknown])
+        return fields
+
+    def get_cache_config(self):
+        """
+        Returns settings of the handler the cached body depends on, they
+        are part of the cache key as handlers of a collection share it.
+        """
+        cls = self.__class__
+        return ["{0}.{1}".format(cls.__module__, cls.__name__),
+                self.max_groups]
+
+    def get_match(self):
+        """
+        Returns the query of the request as `$match` stage, raises
+        `InvalidQuery` for near conditions, which `$match` doesn't allow.
+        """
+        match = self.query_spec.query
+        near = near_fields(match)
+        if near:
+            raise InvalidQuery([
+                "near filter of '{0}' is not allowed here".format(field)
+                for field in near])
+        return match
+
+    def group_pipeline(self, match, group_by, stats):
+        """
+        Groups by the list of fields `group_by`, with `{field: value}`
+        keys, or by the values of one field if `group_by` is its name.
+        """
+        if isinstance(group_by, basestring):
+            key = "$" + group_by
+        elif group_by:
+            key = dict((field, "$" + field) for field in group_by)
+        else:
+            key = None
+        group = {
+            "_id": key,
+            "count": {"$sum": 1},
+        }
+        for field in stats:
+            for op in ("sum", "avg", "min", "max"):
+                group["{0}__{1}".format(field, op)] = {
+                    "${0}".format(op): "$" + field}
+        return [
+            {"$match": match},
+            {"$group": group},
+            {"$sort": {"count": -1}},
+            {"$limit": self.max_groups},
+        ]
+
+    def format_group(self, group, stats):
+        result = {"key": group["_id"], "count": group["count"]}
+        if stats:
+            result["stats"] = dict(
+                (field, dict((op, group["{0}__{1}".format(field, op)])
+                             for op in ("sum", "avg", "min", "max")))
+                for field in stats)
+        return result
+
+    @gen.coroutine
+    def run_aggregation(self, match, group_by, stats, facets, distinct):
+        names, pipelines = [], []
+        if group_by or stats:
+            names.append(("groups", None))
+            pipelines.append(self.group_pipeline(match, group_by, stats))
+        # documents without the field are grouped under null
+        for field in facets:
+            names.append(("facets", field))
+            pipelines.append(self.group_pipeline(match, field, []))
+        for field in distinct:
+            names.append(("distinct", field))
+            pipelines.append(self.group_pipeline(match, field, []))
+
+        results = yield [
+            self.model.aggregate_list(self.db, pipe, deadline=self.deadline)
+            for pipe in pipelines]
+
+        response = {}
+        for (kind, field), groups in zip(names, results):
+            if kind == "groups":
+                response[kind] = [
+                    self.format_group(group, stats) for group in groups]
+            elif kind == "facets":
+                response.setdefault(kind, {})[field] = [
+                    {"value": group["_id"], "count": group["count"]}
+                    for group in groups]
+            else:
+                response.setdefault(kind, {})[field] = [
+                    group["_id"] for group in groups]
+        raise gen.Return(response)
+
+    @gen.coroutine
+    @is_allow
+    def get(self, *args, **kwargs):
+        yield self.call_hook(self.pre_get)
+
+        try:
+            group_by = self.get_fields_argument(
+                "$group_by", self.aggregate_fields)
+            stats = self.get_fields_argument("$stats", self.stats_fields)
+            facets = self.get_fields_argument("$facet", self.aggregate_fields)
+            distinct = self.get_fields_argument(
+                "$distinct", self.aggregate_fields)
+            if not (group_by or stats or facets or distinct):
+                raise InvalidQuery([
+                    "One of $group_by, $stats, $facet or $distinct "
+                    "is required"])
+            match = self.get_match()
+        except InvalidQuery as e:
+            self.write_error(400, "Bad Request", e.errors)
+            return
+
+        key = JSONEncoder(sort_keys=True).encode(
+            [self.get_cache_config(), match, group_by, stats, facets,
+             distinct])
+        cache = get_cache(
+            "aggregate.{0}".format(self.model.get_collection()),
+            self.cache_ttl)
+        # the encoded body is cached with its compressed forms
+        body = cache.get(key)
+        if body is None:
+            response = yield self.run_aggregation(
+                match, group_by, stats, facets, distinct)
+            body = CompressedBody(JSONEncoder().encode(response))
+            cache.set(key, body, self.model.get_collection())
+
+        self.render_body(body)
+        self.post_get()
+
+
+class BaseValuesHandler(BaseAggregateHandler):
+    """
+    Returns values of one of `aggregate_fields` for filter lists, with the
+    number of documents per value, most frequent first, or just sorted
+    distinct values with `$counts=false`. Filters of `FilterMixin` apply,
+    at most `max_values` values are returned.
+
+        GET /places/values?$field=city&category=cafe
+        GET /places/values?$field=city&$counts=false
+
+    Only the field is projected after `$match`, so the query is covered
+    by an index on the filtered fields followed by the field.
+    """
+
+    max_values = 100
+
+    def get_cache_config(self):
+        return super(BaseValuesHandler, self).get_cache_config() + \
+            [self.max_values]
+
+    def values_pipeline(self, match, field, counts):
+        pipe = [
+            {"$match": match},
+            {"$project": {"_id": 0, field: 1}},
+        ]
+        if isinstance(self.model._fields.get(field), ListType):
+            pipe.append({"$unwind": "$" + field})
+        pipe.extend([
+            {"$group": {"_id": "$" + field, "count": {"$sum": 1}}},
+            {"$sort": {"count": -1} if counts else {"_id": 1}},
+            {"$limit": self.max_values + 1},
+        ])
+        return pipe
+
+    @gen.coroutine
+    def run_values(self, match, field, counts):
+        groups = yield self.model.aggregate_list(
+            self.db, self.values_pipeline(match, field, counts),
+            deadline=self.deadline)
+        values = [{"value": group["_id"], "count": group["count"]}
+                  for group in groups]
+        response = {
+            "field": field,
+            "truncated": len(values) > self.max_values,
+        }
+        values = values[:self.max_values]
+        response["values"] = values if counts else \
+            [item["value"] for item in values]
+        raise gen.Return(response)
+
+    @gen.coroutine
+    @is_allow
+    def get(self, *args, **kwargs):
+        yield self.call_hook(self.pre_get)
+
+        try:
+            fields = self.get_fields_argument("$field", self.aggregate_fields)
+            if len(fields) != 1:
+                raise InvalidQuery(["One field is required in $field"])
+            match = self.get_match()
+        except InvalidQuery as e:
+            self.write_error(400, "Bad Request", e.errors)
+            return
+        field = fields[0]
+        counts = self.get_argument("$counts", "true").lower() \
+            not in ("false", "0")
+
+        key = JSONEncoder(sort_keys=True).encode(
+            [self.get_cache_config(), match, field, counts])
+        cache = get_cache(
+            "values.{0}".format(self.model.get_collection()),
+            self.cache_ttl)
+        body = cache.get(key)
+        if body is None:
+            response = yield self.run_values(match, field, counts)
+            body = CompressedBody(JSONEncoder().encode(response))
+            cache.set(key, body, self.model.get_collection())
+
+        self.render_body(body)
+        self.post_get()
+
+
+# Streamed request bodies need tornado >= 4.0, older versions buffer the
+# body and BaseBulkHandler feeds it to the parser chunk by chunk.
+stream_request_body = getattr(web, "stream_request_body", lambda cls: cls)
+
+
+@stream_request_body
+class BaseBulkHandler(BaseHandler):
+    """
+    Imports NDJSON or a JSON array of objects. Records are parsed and
+    validated as the body arrives and inserted in batches of `batch_size`;
+    the next chunk is not read until the batch is written. Invalid records
+    are skipped and reported, at most `max_errors` of them.
+
+    `pre_post` runs in `prepare`, before the first record is inserted.
+    Streamed bodies may be up to `max_body_size` bytes.
+    """
+
+    allowed_methods = ["options", "post"]
+
+    batch_size = 500
+    chunk_size = 64 * 1024
+    max_errors = 100
+    max_record_size = 1024 * 1024
+    max_body_size = 1024 * 1024 * 1024
+
+    _parser = None
+    _streamed = False
+
+    @gen.coroutine
+    def prepare(self):
+        # set_max_body_size is only there with tornado >= 4.0
+        connection = self.request.connection
+        if self.max_body_size and \
+                hasattr(connection, "set_max_body_size"):
+            connection.set_max_body_size(self.max_body_size)
+        self._parser = RecordParser(self.max_record_size)
+        self._batch = []
+        self._parse_error = None
+        self.received = 0
+        self.inserted = 0
+        self.errors = []
+        yield super(BaseBulkHandler, self).prepare()
+        if self._finished or self.request.method != "POST":
+            return
+        if "post" not in self.allowed_methods:
+            self.write_error(405, "You can't make it", [])
+            return
+        yield self.call_hook(self.pre_post)
+
+    def data_received(self, chunk):
+        self._streamed = True
+        return self.feed(chunk)
+
+    @gen.coroutine
+    def feed(self, chunk, final=False):
+        if self._parse_error:
+            return
+        try:
+            records = self._parser.feed(chunk)
+            if final:
+                records += self._parser.close()
+        except RecordParseError as e:
+            self._parse_error = str(e)
+            return
+        for record in records:
+            self.add_record(record)
+            if len(self._batch) >= self.batch_size:
+                yield self.flush_batch()
+
+    def add_record(self, record):
+        index = self.received
+        self.received += 1
+        validator = self.get_validator()
+        try:
+            if validator is not None:
+                data = validator.validate(record)
+            else:
+                object = self.model(record)
+                object.validate(strict=True)
+                data = object.get_data_for_save(None)
+        except (ModelConversionError, ValidationError) as e:
+            if len(self.errors) < self.max_errors:
+                self.errors.append({"index": index, "errors": e.messages})
+        else:
+            self._batch.append(data)
+
+    @gen.coroutine
+    def flush_batch(self):
+        batch, self._batch = self._batch, []
+        if batch:
+            yield self.model.insert_many(
+                self.db, batch, deadline=self.deadline)
+            self.inserted += len(batch)
+            self.on_progress()
+
+    def on_progress(self):
+        l.info("{0}: {1} records received, {2} inserted".format(
+            self.__class__.__name__, self.received, self.inserted))
+
+    @gen.coroutine
+    @is_allow
+    def post(self, *args, **kwargs):
+        if not self._streamed:
+            body = self.request.body
+            for start in xrange(0, len(body), self.chunk_size):
+                yield self.feed(body[start:start + self.chunk_size])
+        yield self.feed(b"", final=True)
+
+        if self._parse_error:
+            self.write_error(400, "Bad Request", [
+                self._parse_error,
+                "{0} records were inserted before the error".format(
+                    self.inserted)])
+            return
+        yield self.flush_batch()
+
+        self.render({
+            "received": self.received,
+            "inserted": self.inserted,
+            "errors": self.errors,
+        })
+        self.post_post()
+
+
+class ReadinessHandler(SimpleHandler):
+    """
+    Answers 200 once `libs.db.startup` has finished, 503 before that.
+    """
+
+    def initialize(self, **kwargs):
+        self.db = self.settings.get("db")
+
+    def get(self, *args, **kwargs):
+        if self.settings.get("ready", True):
+            self.render({"ready": True})
+        else:
+            self.set_status(503)
+            self.render({"ready": False})
+
+    def head(self, *args, **kwargs):
+        if not self.settings.get("ready", True):
+            self.set_status(503)
+        self.finish()
+
+
+class AdmissionStatsHandler(SimpleHandler):
+    """
+    Exposes in flight counters, queue depth and shed counts of all
+    admission gates.
+    """
+
+    def get(self, *args, **kwargs):
+        self.render(admission.stats())
+
+
+class IndexAdvisorHandler(SimpleHandler):
+    """
+    Reports slow queries recorded by the `index_advisor` setting
+    which are not served by an index.
+    """
+
+    @gen.coroutine
+    def get(self, *args, **kwargs):
+        advisor = self.settings.get("index_advisor")
+        report = []
+        if advisor is not None:
+            report = yield advisor.report(self.db)
+        self.render(report)
+
+
+class ProfilesHandler(SimpleHandler):
+    """
+    Lists recent request profiles of the `profiler` setting, or returns
+    collapsed stacks of one profile for flamegraph.pl.
+    """
+
+    def get(self, profile_id=None, *args, **kwargs):
+        profiler = self.settings.get("profiler")
+        if profiler is None:
+            self.render([])
+            return
+        if not profile_id:
+            self.render([profile.summary()
+                         for profile in reversed(profiler.profiles)])
+            return
+        profile = profiler.get(profile_id)
+        if profile is None:
+            self.write_error(404, "Not Found", [])
+            return
+        self.set_header("Content-Type", "text/plain")
+        self.finish(profile.collapsed())
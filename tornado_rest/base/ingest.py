@@ -0,0 +1,121 @@
+import json
+
+WHITESPACE = ' \t\r\n'
+
+
+class RecordParseError(ValueError):
+    pass
+
+
+class RecordParser(object):
+    """
+    Incremental parser of NDJSON or of a JSON array of objects. Chunks of
+    the body are fed as they arrive and complete records are returned, so
+    the whole body is never decoded at once.
+
+    Example:
+        parser = RecordParser()
+        for chunk in chunks:
+            for record in parser.feed(chunk):
+                process(record)
+        parser.close()
+    """
+
+    def __init__(self, max_record_size=1024 * 1024):
+        self.max_record_size = max_record_size
+        self.mode = None
+        self.closed = False
+        self._buffer = u''
+        self._decoder = json.JSONDecoder()
+        self._pending = b''
+
+    def _decode(self, chunk):
+        # keep incomplete utf-8 sequences for the next chunk
+        data = self._pending + chunk
+        for cut in xrange(len(data), max(len(data) - 4, -1), -1):
+            try:
+                text = data[:cut].decode('utf-8')
+            except UnicodeDecodeError:
+                continue
+            self._pending = data[cut:]
+            return text
+        raise RecordParseError("Body is not utf-8")
+
+    def feed(self, chunk):
+        if isinstance(chunk, bytes):
+            chunk = self._decode(chunk)
+        self._buffer += chunk
+        if self.mode is None:
+            stripped = self._buffer.lstrip(WHITESPACE)
+            if not stripped:
+                return []
+            if stripped[0] == '[':
+                self.mode = 'array'
+                self._buffer = stripped[1:]
+            else:
+                self.mode = 'lines'
+        records = self._parse_lines() if self.mode == 'lines' \
+            else self._parse_array()
+        if len(self._buffer) > self.max_record_size:
+            raise RecordParseError("Record is too large")
+        return records
+
+    def _parse_lines(self, final=False):
+        lines = self._buffer.split('\n')
+        self._buffer = u'' if final else lines.pop()
+        records = []
+        for line in lines:
+            line = line.strip()
+            if line:
+                records.append(self._load(line))
+        return records
+
+    def _parse_array(self):
+        records = []
+        buffer, position = self._buffer, 0
+        while True:
+            while position < len(buffer) and buffer[position] in WHITESPACE:
+                position += 1
+            if position == len(buffer):
+                break
+            if buffer[position] == ']':
+                self.closed = True
+                position += 1
+                break
+            if buffer[position] == ',':
+                position += 1
+                continue
+            try:
+                record, end = self._decoder.raw_decode(buffer, position)
+            except ValueError:
+                # incomplete record, wait for the next chunk
+                break
+            records.append(self._check(record))
+            position = end
+        self._buffer = buffer[position:]
+        return records
+
+    def _load(self, text):
+        try:
+            return self._check(json.loads(text))
+        except ValueError:
+            raise RecordParseError("Invalid JSON line")
+
+    def _check(self, record):
+        if not isinstance(record, dict):
+            raise RecordParseError("Records must be objects")
+        return record
+
+    def close(self):
+        """
+        Returns the remaining records, raises RecordParseError if the body
+        is truncated.
+        """
+        if self._pending:
+            raise RecordParseError("Body is not utf-8")
+        if self.mode == 'lines':
+            return self._parse_lines(final=True)
+        if self.mode == 'array' and \
+                (not self.closed or self._buffer.strip(WHITESPACE)):
+            raise RecordParseError("Invalid JSON array")
+        return []
@@ -0,0 +1,180 @@
+import logging
+import uuid
+from datetime import timedelta
+import motor
+from bson.objectid import ObjectId
+from bson.son import SON
+from bson.timestamp import Timestamp
+from tornado import gen, ioloop
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from . import cache
+from .replica import replicas_of
+
+l = logging.getLogger(__name__)
+
+_bus = None
+
+
+def get_bus():
+    return _bus
+
+
+def set_bus(bus):
+    global _bus
+    _bus = bus
+
+
+class Transport(object):
+    """
+    Delivers invalidation events between nodes.
+    """
+
+    def publish(self, event):
+        """
+        Sends the event to all nodes, returns Future.
+        """
+        raise NotImplementedError()
+
+    def start(self, callback):
+        """
+        Starts calling `callback` with every published event.
+        """
+        raise NotImplementedError()
+
+    def stop(self):
+        pass
+
+
+class MongoCappedTransport(Transport):
+    """
+    Publishes events into a capped collection and reads them back with a
+    tailable cursor. Subscribers see events with a delay of at most
+    `retry_interval` seconds plus the server await time.
+
+    Events get `ts` timestamp from the server on insert, which grows in
+    insertion order whichever node published the event, so tailing
+    resumes after the last seen `ts`.
+    """
+
+    def __init__(self, db, collection="invalidation_events",
+                 size=1024 * 1024, retry_interval=1):
+        self.db = db
+        self.collection = collection
+        self.size = size
+        self.retry_interval = retry_interval
+        self._running = False
+
+    @gen.coroutine
+    def ensure_collection(self):
+        try:
+            yield motor.Op(self.db.create_collection, self.collection,
+                           capped=True, size=self.size)
+        except CollectionInvalid:
+            pass
+
+    @gen.coroutine
+    def publish(self, event):
+        # the server replaces an empty timestamp in the first two fields
+        document = SON([("_id", ObjectId()), ("ts", Timestamp(0, 0))])
+        document.update(event)
+        yield motor.Op(self.db[self.collection].insert, document)
+
+    @gen.coroutine
+    def start(self, callback):
+        yield self.ensure_collection()
+        self._running = True
+        newest = yield motor.Op(
+            self.db[self.collection].find().sort("$natural", -1).limit(1)
+            .to_list, 1)
+        last_ts = newest[0].get("ts") if newest else None
+        self._tail(callback, last_ts)
+
+    def stop(self):
+        self._running = False
+
+    @gen.coroutine
+    def _tail(self, callback, last_ts):
+        io_loop = ioloop.IOLoop.current()
+        while self._running:
+            query = {"ts": {"$gt": last_ts}} if last_ts else {}
+            cursor = self.db[self.collection].find(
+                query, tailable=True, await_data=True)
+            try:
+                while self._running and cursor.alive:
+                    if (yield cursor.fetch_next):
+                        event = cursor.next_object()
+                        last_ts = event.get("ts", last_ts)
+                        try:
+                            callback(event)
+                        except Exception:
+                            l.exception("Invalidation event {0} failed"
+                                        .format(event))
+            except PyMongoError as e:
+                # e.g. CappedPositionLost, tailing goes on after the last
+                # seen event
+                l.warning("{0} while tailing '{1}': {2}".format(
+                    e.__class__.__name__, self.collection, e))
+            yield gen.Task(io_loop.add_timeout,
+                           timedelta(seconds=self.retry_interval))
+
+
+class InvalidationBus(object):
+    """
+    Tells other nodes about writes made through `BaseModel`, so they evict
+    cached entries and reload in memory replicas of the collection.
+
+    Example:
+        bus = InvalidationBus(MongoCappedTransport(db))
+        set_bus(bus)
+        yield bus.start()
+    """
+
+    def __init__(self, transport, node_id=None):
+        self.transport = transport
+        self.node_id = node_id or uuid.uuid4().hex
+        self._subscribers = [evict]
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def start(self):
+        return self.transport.start(self.on_event)
+
+    def stop(self):
+        self.transport.stop()
+
+    @gen.coroutine
+    def publish(self, collection, _id=None):
+        """
+        Publishes change of the document, or of the whole collection if
+        `_id` is not known.
+        """
+        event = {
+            "collection": collection,
+            "doc_id": _id,
+            "node": self.node_id,
+        }
+        try:
+            yield self.transport.publish(event)
+        except Exception:
+            # the write is done, a lost event only leaves caches of other
+            # nodes stale until their entries expire
+            l.exception("Invalidation of '{0}' is not published"
+                        .format(collection))
+
+    def on_event(self, event):
+        if event.get("node") == self.node_id:
+            return
+        for callback in self._subscribers:
+            callback(event)
+
+
+def evict(event):
+    """
+    Default subscriber, evicts caches and reloads replica of the collection.
+    """
+    collection = event["collection"]
+    cache.invalidate(collection, event.get("doc_id"))
+    for replica in replicas_of(collection):
+        replica.changed()
@@ -1,5 +1,24 @@
 from schematics.transforms import blacklist, whitelist
-import itertools
+
+from .models import GeoPoint
+from .query import InvalidQuery, DEFAULT_SORT, TEXT_SCORE, TEXT_SCORE_META
+
+
+def parse_coordinates(value):
+    """
+    Parses 'lng,lat,lng,lat,...' into list of [lng, lat] pairs.
+    """
+    try:
+        numbers = [float(item) for item in value.split(',')]
+    except ValueError:
+        raise InvalidQuery(["Coordinates must be numbers"])
+    if len(numbers) % 2:
+        raise InvalidQuery(["Coordinates must be lng,lat pairs"])
+    points = [numbers[i:i + 2] for i in xrange(0, len(numbers), 2)]
+    for lng, lat in points:
+        if not -180 <= lng <= 180 or not -90 <= lat <= 90:
+            raise InvalidQuery(["Coordinates are out of range"])
+    return points
 
 
 class BaseMixin(object):
@@ -8,7 +27,7 @@ class BaseMixin(object):
 
 class SortMixin(BaseMixin):
 
-    def prepare(self):
+    def build_query_spec(self, spec):
 
         sort = self.get_argument('$sort', None, strip=False)
         sort_list = []
@@ -17,6 +36,8 @@ class SortMixin(BaseMixin):
             sort_params = sort.split(',')
             for p in sort_params:
                 p = ''.join(p.split())
+                if not p:
+                    continue
                 if u'-' == p[0]:
                     direction = -1
                     p = p[1:]
@@ -25,71 +46,162 @@ class SortMixin(BaseMixin):
                     p = p[1:]
                 else:
                     direction = 1
+                if TEXT_SCORE == p and \
+                        TEXT_SCORE not in self.get_query_model().fields:
+                    # relevance of $search, always the most relevant first
+                    direction = TEXT_SCORE_META
                 sort_list.append((p, direction))
 
         if sort_list:
-            self._sort = sort_list
+            spec = spec.order_by(sort_list)
 
-        super(SortMixin, self).prepare()
+        return super(SortMixin, self).build_query_spec(spec)
 
 
 class PaginationMixin(BaseMixin):
 
-    def prepare(self):
+    def build_query_spec(self, spec):
 
-        page = int(self.get_argument('$page', 0))
-        display = int(self.get_argument('$display', 20))
-        self._skip = page * display
-        self._limit = display
+        try:
+            page = int(self.get_argument('$page', 0))
+            display = int(self.get_argument('$display', 20))
+        except ValueError:
+            raise InvalidQuery(["$page and $display must be integers"])
+        spec = spec.paginate(page * display, display)
 
-        super(PaginationMixin, self).prepare()
+        return super(PaginationMixin, self).build_query_spec(spec)
 
 
 class FilterMixin(BaseMixin):
-
-    def prepare(self):
-        modifications = {'__lte': '$lte', '__lt': '$lt', '__gte': '$gte', '__gt': '$gt', '__in': '$in', '': ''}
-        fields = self.model.fields.keys()
+    """
+    Builds query from `field=value` and `field__<modification>=value`
+    arguments. `GeoPoint` fields also accept
+    `field__near=lng,lat&$max_distance=<meters>` and
+    `field__within=<min lng,min lat,max lng,max lat>` or
+    `field__within=<lng,lat,lng,lat,...>` polygon.
+    """
+    modifications = {'lte': '$lte', 'lt': '$lt', 'gte': '$gte', 'gt': '$gt',
+                     'in': '$in'}
+    geo_modifications = ('near', 'within')
+
+    def geo_condition(self, modification, value):
+        points = parse_coordinates(value)
+        if 'near' == modification:
+            if len(points) != 1:
+                raise InvalidQuery(["near takes one lng,lat point"])
+            condition = {"$geometry": {"type": "Point",
+                                       "coordinates": points[0]}}
+            max_distance = self.get_argument('$max_distance', None)
+            if max_distance:
+                try:
+                    condition["$maxDistance"] = float(max_distance)
+                except ValueError:
+                    raise InvalidQuery(["$max_distance must be a number"])
+            return {"$nearSphere": condition}
+        if len(points) == 2:
+            (min_lng, min_lat), (max_lng, max_lat) = points
+            points = [[min_lng, min_lat], [max_lng, min_lat],
+                      [max_lng, max_lat], [min_lng, max_lat]]
+        if points[0] != points[-1]:
+            points.append(points[0])
+        if len(points) < 4:
+            # closed ring of at least three distinct corners
+            raise InvalidQuery(["within takes a bbox or a polygon"])
+        return {"$geoWithin": {"$geometry": {"type": "Polygon",
+                                             "coordinates": [points]}}}
+
+    def build_query_spec(self, spec):
+        fields = self.get_query_model().fields
         query = {}
 
-        for field in itertools.product(fields, modifications.keys()):
-            param = ''.join(field)
+        for param in self.request.arguments:
+            if param in fields:
+                field, modification = param, None
+            else:
+                field, _, modification = param.rpartition('__')
+                if modification in self.geo_modifications:
+                    if not isinstance(fields.get(field), GeoPoint):
+                        continue
+                elif field not in fields or \
+                        modification not in self.modifications:
+                    continue
             value = self.get_argument(param, None)
-            if value:
-                if '__in' == field[1]:
-                    query[field[0]] = {modifications[field[1]]: value.split(',')}
-                elif '' == field[1]:
-                    query[field[0]] = value
-                else:
-                    query[field[0]] = {modifications[field[1]]: value}
-        self._query = query
-        super(FilterMixin, self).prepare()
+            if not value:
+                continue
+            if modification in self.geo_modifications:
+                query[field] = self.geo_condition(modification, value)
+                if 'near' == modification and spec.sort == DEFAULT_SORT:
+                    # $nearSphere sorts by distance itself
+                    spec = spec.order_by([])
+            elif modification is None:
+                query[field] = value
+            else:
+                if 'in' == modification:
+                    value = value.split(',')
+                condition = query.get(field)
+                if not isinstance(condition, dict):
+                    condition = query[field] = {}
+                condition[self.modifications[modification]] = value
+
+        if query:
+            spec = spec.filter(query)
+        return super(FilterMixin, self).build_query_spec(spec)
+
+
+class SearchMixin(BaseMixin):
+    """
+    Full text search with `$search=<text>` for models with
+    `MONGO_TEXT_FIELDS`. Documents get relevance `_score`, which is also
+    the default sort and may be used as `$sort=_score`.
+    """
+
+    def build_query_spec(self, spec):
+        search = self.get_argument('$search', None)
+
+        if search:
+            model = self.get_query_model()
+            if not model.get_text_fields():
+                raise InvalidQuery(["Search is not supported"])
+            if TEXT_SCORE in model.fields:
+                raise InvalidQuery(["Field '{0}' hides search relevance"
+                                    .format(TEXT_SCORE)])
+            spec = spec.search(search)
+            if spec.sort == DEFAULT_SORT:
+                spec = spec.order_by([(TEXT_SCORE, TEXT_SCORE_META)])
+
+        return super(SearchMixin, self).build_query_spec(spec)
 
 
 class OnlyMixin(BaseMixin):
 
-    def prepare(self):
+    def build_query_spec(self, spec):
 
         only = self.get_argument('$only', None)
 
         if only:
-            self._fields = {}
+            fields = {}
             for field in only.split(','):
-                self._fields[''.join(field.split())] = 1
+                field = ''.join(field.split())
+                if field:
+                    fields[field] = 1
+            spec = spec.merge_projection(fields)
 
-        super(OnlyMixin, self).prepare()
+        return super(OnlyMixin, self).build_query_spec(spec)
 
 
 class ExcludeMixin(BaseMixin):
 
-    def prepare(self):
+    def build_query_spec(self, spec):
         exclude = self.get_argument('$exclude', None)
         if exclude:
-            self._fields = {}
+            fields = {}
             for field in exclude.split(','):
-                self._fields[''.join(field.split())] = 0
+                field = ''.join(field.split())
+                if field:
+                    fields[field] = 0
+            spec = spec.merge_projection(fields)
 
-        super(ExcludeMixin, self).prepare()
+        return super(ExcludeMixin, self).build_query_spec(spec)
 
 
 class EmbedMixin(BaseMixin):
@@ -98,4 +210,3 @@ class EmbedMixin(BaseMixin):
 
 class FieldMixin(BaseMixin):
     pass
-
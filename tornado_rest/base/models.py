@@ -1,4 +1,6 @@
 import logging
+import time
+from functools import partial
 from datetime import timedelta
 from bson.objectid import ObjectId
 from tornado import gen, ioloop
@@ -7,6 +9,18 @@ import motor
 from schematics.models import Model
 from schematics.types import NumberType, BaseType
 from pymongo.errors import ConnectionFailure
+from .admission import get_gate
+from .deadline import DeadlineExceeded, ExecutionTimeout, SERVER_TIME_LIMITS
+from .query import near_fields
+from .replica import get_replica, replicas_of, ReplicaCursor
+from .routing import (get_connection, shard_for, ScatterCursor,
+                      split_pipeline, merge_aggregation)
+from .invalidation import get_bus
+from .profiling import current_profile
+from .validation import FastValidator
+from .projection import projected_names, ProjectionSerializer
+from .records import make_record_class
+from . import cache
 
 l = logging.getLogger(__name__)
 MAX_FIND_LIST_LEN = 100
@@ -87,10 +101,37 @@ class BaseModel(Model):
     Same example, but using MyModel.find_one:
 
         obj = yield MyModel.find_one(db, {"i": 3})
+
+    Indexes are declared next to the collection name and created by
+    `ensure_indexes`:
+
+        MONGO_COLLECTION = "places"
+        MONGO_INDEXES = [
+            "name",
+            [("category", 1), ("rating", -1)],
+            {"keys": [("created", 1)], "expireAfterSeconds": 3600},
+            {"keys": [("location", "2dsphere")]},
+        ]
+        MONGO_TEXT_FIELDS = {"name": 10, "description": 1}
+
+    Small reference collections may be kept in memory with `IN_MEMORY`,
+    `find_one`, `get_cursor`, `find` and `count` are then answered without
+    touching the network:
+
+        IN_MEMORY = True
+        IN_MEMORY_KEYS = ["code"]
+        IN_MEMORY_REFRESH = 60
+
+    Large collections may be spread over several databases, registered
+    with `routing.register_connection`. Documents are placed by the hash
+    of `SHARD_KEY`, queries without the key are sent to all shards and
+    their results are merged:
+
+        SHARD_KEY = "account_id"
+        SHARDS = ["main", "eu"]
     """
 
     _id = NumberType(number_class=ObjectId, number_type="ObjectId")
-    _references = []
 
     @classmethod
     def get_reference_type(cls, name):
@@ -106,10 +147,84 @@ class BaseModel(Model):
 
     @classmethod
     def references(cls):
-        for item in cls._fields.items():
-            if isinstance(item[1], ReferenceType):
-                cls._references.append(item[0])
-        return cls._references
+        references = cls.__dict__.get('_references')
+        if references is None:
+            references = [name for name, field in cls._fields.items()
+                          if isinstance(field, ReferenceType)]
+            cls._references = references
+        return references
+
+    @classmethod
+    def get_read_fields(cls):
+        """
+        Returns names of fields visible in responses, that is declared
+        fields without the ones hidden by the 'role' role.
+        """
+        fields = cls.__dict__.get('_read_fields')
+        if fields is None:
+            fields = list(cls._fields.keys())
+            if 'role' in cls._options.roles:
+                role = cls._options.roles['role']
+                fields = [name for name in fields if not role(name, None)]
+            cls._read_fields = fields
+        return fields
+
+    @classmethod
+    def get_validator(cls):
+        """
+        Returns `FastValidator` of the model, compiled once per class.
+        """
+        validator = cls.__dict__.get('_validator')
+        if validator is None:
+            validator = cls._validator = FastValidator(cls)
+        return validator
+
+    @classmethod
+    def get_serializer(cls, projection=None):
+        """
+        Returns `ProjectionSerializer` emitting only the visible fields
+        kept by `projection`, cached per projection.
+        """
+        projection = dict((name, value)
+                          for name, value in (projection or {}).items()
+                          if not isinstance(value, dict))
+        key = frozenset(projection.items())
+        serializers = cls.__dict__.get('_serializers')
+        if serializers is None:
+            serializers = cls._serializers = {}
+        serializer = serializers.get(key)
+        if serializer is None:
+            serializer = serializers[key] = ProjectionSerializer(
+                cls, projected_names(cls.get_read_fields(), projection))
+        return serializer
+
+    @classmethod
+    def raw_projection(cls, fields=None):
+        """
+        Turns `$only`/`$exclude` projection into inclusive projection of
+        visible fields, so raw documents never carry anything else.
+        """
+        allowed = cls.get_read_fields()
+        fields = dict((name, value) for name, value in (fields or {}).items()
+                      if not isinstance(value, dict))
+        if any(fields.values()):
+            names = [name for name in allowed if fields.get(name)]
+        else:
+            names = [name for name in allowed if name not in fields]
+        projection = dict((name, 1) for name in names)
+        if '_id' not in projection and projection:
+            projection['_id'] = 0
+        return projection or {'_id': 1}
+
+    @classmethod
+    def raw_to_json(cls, data):
+        """
+        Prepares raw document, fetched with `raw_projection`, for
+        rendering without building the model.
+        """
+        if isinstance(data.get('_id'), ObjectId):
+            data['_id'] = str(data['_id'])
+        return data
 
     def to_json(self):
         json_data = self
@@ -132,33 +247,184 @@ class BaseModel(Model):
     def check_collection(cls, collection):
         return collection or cls.get_collection()
 
+    @classmethod
+    def get_indexes(cls):
+        """
+        Returns declared indexes as list of (keys, options) pairs.
+        `GeoPoint` fields get a 2dsphere index unless they lead a declared
+        index, `MONGO_TEXT_FIELDS` make the text index.
+        """
+        indexes = []
+        for index in getattr(cls, 'MONGO_INDEXES', []):
+            if isinstance(index, dict):
+                index_options = dict(index)
+                keys = index_options.pop('keys')
+            else:
+                keys, index_options = index, {}
+            if isinstance(keys, basestring):
+                keys = [(keys, 1)]
+            indexes.append((list(keys), index_options))
+        text_fields = cls.get_text_fields()
+        if text_fields:
+            indexes.append((
+                [(name, "text") for name in sorted(text_fields)],
+                {"weights": text_fields, "name": "text"}))
+        declared = set(keys[0][0] for keys, _ in indexes)
+        for name, field in cls._fields.items():
+            if isinstance(field, GeoPoint) and name not in declared:
+                indexes.append(([(name, "2dsphere")], {}))
+        return indexes
+
+    @classmethod
+    def get_text_fields(cls):
+        """
+        Returns text indexed fields with their weights.
+        """
+        fields = getattr(cls, 'MONGO_TEXT_FIELDS', None) or {}
+        if not isinstance(fields, dict):
+            fields = dict((name, 1) for name in fields)
+        return fields
+
+    @classmethod
+    @gen.coroutine
+    def ensure_indexes(cls, db, collection=None):
+        """
+        Creates declared indexes which do not exist yet.
+        Example:
+            yield ExampleModel.ensure_indexes(self.db)
+        """
+        c = cls.check_collection(collection)
+        for shard_db in cls.route(db):
+            yield cls._ensure_indexes_in(shard_db, c)
+
+    @classmethod
+    @gen.coroutine
+    def _ensure_indexes_in(cls, db, c):
+        for keys, index_options in cls.get_indexes():
+            for i in cls.reconnect_amount():
+                try:
+                    name = yield cls.run_op(
+                        db[c].ensure_index, keys, **index_options)
+                except ConnectionFailure as e:
+                    exceed = yield cls.check_reconnect_tries_and_wait(
+                        i,
+                        'ensure_indexes')
+                    if exceed:
+                        raise e
+                else:
+                    l.info("Index {0} of {1} is ensured".format(name, c))
+                    break
+
+    @classmethod
+    def route(cls, db, source=None):
+        """
+        Returns list of databases holding documents which match the query
+        or the document `source`. Not sharded models always use `db`.
+        """
+        shards = getattr(cls, 'SHARDS', None)
+        key = getattr(cls, 'SHARD_KEY', None)
+        if not shards or not key:
+            return [db]
+        value = (source or {}).get(key)
+        if value is not None and not isinstance(value, dict):
+            return [get_connection(shard_for(value, shards))]
+        return [get_connection(name) for name in shards]
+
+    @classmethod
+    def is_scattered(cls, query):
+        """
+        Returns True if the query of a sharded model runs on every shard.
+        """
+        if not getattr(cls, 'SHARDS', None) or \
+                not getattr(cls, 'SHARD_KEY', None):
+            return False
+        value = (query or {}).get(cls.SHARD_KEY)
+        return value is None or isinstance(value, dict)
+
+    @classmethod
+    def route_one(cls, db, document):
+        """
+        Returns the database the document is written to.
+        """
+        dbs = cls.route(db, document)
+        if len(dbs) > 1:
+            raise ValueError("'{0}' document has no shard key '{1}'"
+                             .format(cls.__name__, cls.SHARD_KEY))
+        return dbs[0]
+
     @classmethod
     def find_list_len(cls):
         return getattr(cls, 'FIND_LIST_LEN', MAX_FIND_LIST_LEN)
 
     @classmethod
     @gen.coroutine
-    def find_one(cls, db, query, collection=None, model=True):
+    def find_one(cls, db, query, collection=None, model=True, deadline=None,
+                 fields=None):
         result = None
+        c = cls.check_collection(collection)
         query = cls.process_query(query)
+        replica = cls.get_replica(collection)
+        cursor = replica.cursor(query, fields) if replica else None
+        if cursor is not None:
+            result = cursor.fetch(1)
+            result = result[0] if result else None
+            if model and result:
+                result = cls.make_result(result, model, "find_one")
+            raise gen.Return(result)
+        results = yield cls.scatter([
+            partial(cls._find_one_in, shard_db, c, query, fields, deadline)
+            for shard_db in cls.route(db, query)
+        ], deadline)
+        result = next((result for result in results if result), None)
+        if model and result:
+            result = cls.make_result(result, model, "find_one")
+        raise gen.Return(result)
+
+    @classmethod
+    @gen.coroutine
+    def _find_one_in(cls, db, c, query, fields, deadline, gated=True):
         for i in cls.reconnect_amount():
             try:
-                result = yield motor.Op(
-                    db[cls.check_collection(collection)].find_one, query)
+                if deadline is None or not SERVER_TIME_LIMITS:
+                    result = yield cls.run_op(
+                        db[c].find_one, query, fields, deadline=deadline,
+                        gated=gated)
+                else:
+                    cursor = deadline.limit(
+                        db[c].find(query, fields).limit(1))
+                    result = yield cls.run_op(
+                        cursor.to_list, 1, deadline=deadline, gated=gated)
+                    result = result[0] if result else None
             except ConnectionFailure as e:
                 exceed = yield cls.check_reconnect_tries_and_wait(
                     i,
-                    'find_one')
+                    'find_one', deadline)
                 if exceed:
                     raise e
             else:
-                if model and result:
-                    result = cls.make_model(result, "find_one")
                 raise gen.Return(result)
 
+    @staticmethod
+    @gen.coroutine
+    def find_one_each(db, lookups, deadline=None):
+        """
+        Runs `find_one` for each (model, query) pair concurrently and
+        returns the results in the same order.
+        Example:
+            user, group = yield BaseModel.find_one_each(self.db, [
+                (UserModel, {"_id": user_id}),
+                (GroupModel, {"_id": group_id}),
+            ])
+        """
+        result = yield [
+            model.find_one(db, query, deadline=deadline)
+            for model, query in lookups
+        ]
+        raise gen.Return(result)
+
     @classmethod
     @gen.coroutine
-    def remove_entries(cls, db, query, collection=None):
+    def remove_entries(cls, db, query, collection=None, deadline=None):
         """
         Removes documents by given query.
         Example:
@@ -167,20 +433,30 @@ class BaseModel(Model):
         """
         c = cls.check_collection(collection)
         query = cls.process_query(query)
+        yield cls.scatter([
+            partial(cls._remove_in, shard_db, c, query, deadline)
+            for shard_db in cls.route(db, query)
+        ], deadline)
+        yield cls.notify_write(db, collection, query.get("_id"))
+
+    @classmethod
+    @gen.coroutine
+    def _remove_in(cls, db, c, query, deadline, gated=True):
         for i in cls.reconnect_amount():
             try:
-                yield motor.Op(db[c].remove, query)
+                yield cls.run_op(db[c].remove, query, deadline=deadline,
+                                 gated=gated)
             except ConnectionFailure as e:
                 exceed = yield cls.check_reconnect_tries_and_wait(
                     i,
-                    'remove_entries')
+                    'remove_entries', deadline)
                 if exceed:
                     raise e
             else:
                 return
 
     @gen.coroutine
-    def remove(self, db, collection=None):
+    def remove(self, db, collection=None, deadline=None):
         """
         Removes current instance from database.
         Example:
@@ -188,10 +464,10 @@ class BaseModel(Model):
             yield obj.remove(self.db)
         """
         _id = self.to_primitive()['_id']
-        yield self.remove_entries(db, {"_id": _id}, collection)
+        yield self.remove_entries(db, {"_id": _id}, collection, deadline)
 
     @gen.coroutine
-    def save(self, db, collection=None, ser=None):
+    def save(self, db, collection=None, ser=None, deadline=None):
         """
         If object has _id, then object will be rewritten.
         If not, object will be inserted and _id will be assigned.
@@ -201,21 +477,25 @@ class BaseModel(Model):
         """
         c = self.check_collection(collection)
         data = self.get_data_for_save(ser)
+        shard_db = self.route_one(db, data)
         result = None
         for i in self.reconnect_amount():
             try:
-                result = yield motor.Op(db[c].save, data)
+                result = yield self.run_op(
+                    shard_db[c].save, data, deadline=deadline)
             except ConnectionFailure as e:
-                exceed = yield self.check_reconnect_tries_and_wait(i, 'save')
+                exceed = yield self.check_reconnect_tries_and_wait(
+                    i, 'save', deadline)
                 if exceed:
                     raise e
             else:
                 if result:
                     self._id = result
+                yield self.notify_write(db, collection, self._id)
                 return
 
     @gen.coroutine
-    def insert(self, db, collection=None, ser=None, **kwargs):
+    def insert(self, db, collection=None, ser=None, deadline=None, **kwargs):
         """
         If object has _id, then object will be inserted with given _id.
         If object with such _id is already in database, then
@@ -227,23 +507,85 @@ class BaseModel(Model):
             obj = ExampleModel({"first_name": "Vasya"})
             yield obj.insert(self.db)
         """
-        c = self.check_collection(collection)
         data = self.get_data_for_save(ser)
-        for i in self.reconnect_amount():
+        result = yield self.insert_document(
+            db, data, collection, deadline, **kwargs)
+        if result:
+            self._id = result
+
+    @classmethod
+    @gen.coroutine
+    def insert_document(cls, db, data, collection=None, deadline=None,
+                        **kwargs):
+        """
+        Inserts document (dict) as is and returns its _id.
+        Example:
+            _id = yield ExampleModel.insert_document(
+                self.db, {"first_name": "Vasya"})
+        """
+        c = cls.check_collection(collection)
+        shard_db = cls.route_one(db, data)
+        for i in cls.reconnect_amount():
             try:
-                result = yield motor.Op(db[c].insert, data, **kwargs)
+                result = yield cls.run_op(
+                    shard_db[c].insert, data, deadline=deadline, **kwargs)
             except ConnectionFailure as e:
-                exceed = yield self.check_reconnect_tries_and_wait(i, 'insert')
+                exceed = yield cls.check_reconnect_tries_and_wait(
+                    i, 'insert', deadline)
                 if exceed:
                     raise e
             else:
-                if result:
-                    self._id = result
-                return
+                yield cls.notify_write(db, collection, result)
+                raise gen.Return(result)
+
+    @classmethod
+    @gen.coroutine
+    def insert_many(cls, db, documents, collection=None, deadline=None):
+        """
+        Inserts list of documents (dicts) with one request and returns
+        their _ids.
+        Example:
+            ids = yield ExampleModel.insert_many(
+                self.db, [obj.to_primitive() for obj in objects])
+        """
+        c = cls.check_collection(collection)
+        groups = []
+        for document in documents:
+            shard_db = cls.route_one(db, document)
+            for group_db, group in groups:
+                if group_db is shard_db:
+                    group.append(document)
+                    break
+            else:
+                groups.append((shard_db, [document]))
+        results = yield cls.scatter([
+            partial(cls._insert_many_in, group_db, c, group, deadline)
+            for group_db, group in groups
+        ], deadline)
+        yield cls.notify_write(db, collection)
+        if len(results) == 1:
+            raise gen.Return(results[0])
+        # inserted documents carry their _id
+        raise gen.Return([document.get("_id") for document in documents])
+
+    @classmethod
+    @gen.coroutine
+    def _insert_many_in(cls, db, c, documents, deadline, gated=True):
+        for i in cls.reconnect_amount():
+            try:
+                result = yield cls.run_op(
+                    db[c].insert, documents, deadline=deadline, gated=gated)
+            except ConnectionFailure as e:
+                exceed = yield cls.check_reconnect_tries_and_wait(
+                    i, 'insert_many', deadline)
+                if exceed:
+                    raise e
+            else:
+                raise gen.Return(result)
 
     @gen.coroutine
     def update(self, db, query=None, collection=None, ser=None, upsert=False,
-               multi=False):
+               multi=False, deadline=None):
         """
         Updates the object. If object has _id, then try to update the object.
         If object with given _id is not found in database, or object doesn't
@@ -265,42 +607,107 @@ class BaseModel(Model):
         c = self.check_collection(collection)
         data = self.get_data_for_save(ser)
         if query is None and '_id' not in data:
-            yield self.save(db, c, ser=data)
+            yield self.save(db, c, ser=data, deadline=deadline)
         else:
             if not query:
                 _id = data.pop("_id")
                 query = {"_id": _id}
-            for i in self.reconnect_amount():
-                try:
-                    result = yield motor.Op(
-                        db[c].update,
-                        query, {"$set": data}, upsert=upsert, multi=multi)
-                except ConnectionFailure as e:
-                    exceed = yield self.check_reconnect_tries_and_wait(
-                        i,
-                        'update')
-                    if exceed:
-                        raise e
-                else:
-                    l.debug("Update result: {0}".format(result))
-                    return
+            yield self.update_document(
+                db, query, data, collection, upsert, multi, deadline)
+
+    @classmethod
+    @gen.coroutine
+    def update_document(cls, db, query, data, collection=None, upsert=False,
+                        multi=False, deadline=None):
+        """
+        Sets fields of `data` (dict) in the documents matching `query`.
+        Documents of sharded models are updated on the shard they are
+        stored on, `ValueError` is raised if `data` changes the shard key.
+        Example:
+            yield ExampleModel.update_document(
+                self.db, {"_id": _id}, {"last_name": "Bar"})
+        """
+        c = cls.check_collection(collection)
+        key = getattr(cls, 'SHARD_KEY', None)
+        shards = cls.route(db, query)
+        stored = query
+        if len(shards) > 1 and not multi:
+            stored = yield cls.find_one(
+                db, query, collection, model=False, deadline=deadline,
+                fields={key: 1})
+            if stored is not None:
+                shards = cls.route(db, stored)
+            elif not upsert:
+                return
+        if len(shards) > 1 and upsert:
+            shards = [cls.route_one(db, data)]
+        if getattr(cls, 'SHARDS', None) and key in data and \
+                stored is not None and stored.get(key) != data[key]:
+            raise ValueError("Shard key '{0}' of '{1}' can't be changed"
+                             .format(key, cls.__name__))
+        yield cls.scatter([
+            partial(cls._update_in, shard_db, c, query, data, upsert, multi,
+                    deadline)
+            for shard_db in shards
+        ], deadline)
+        yield cls.notify_write(
+            db, collection, None if multi else query.get("_id"))
+
+    @classmethod
+    @gen.coroutine
+    def _update_in(cls, db, c, query, data, upsert, multi, deadline,
+                   gated=True):
+        for i in cls.reconnect_amount():
+            try:
+                result = yield cls.run_op(
+                    db[c].update,
+                    query, {"$set": data}, upsert=upsert, multi=multi,
+                    deadline=deadline, gated=gated)
+            except ConnectionFailure as e:
+                exceed = yield cls.check_reconnect_tries_and_wait(
+                    i,
+                    'update', deadline)
+                if exceed:
+                    raise e
+            else:
+                l.debug("Update result: {0}".format(result))
+                return
 
     @classmethod
-    def get_cursor(cls, db, query, collection=None, fields={}):
+    def get_cursor(cls, db, query, collection=None, fields={}, deadline=None):
         c = cls.check_collection(collection)
         query = cls.process_query(query)
-        return db[c].find(query, fields) if fields else db[c].find(query)
+        replica = cls.get_replica(collection)
+        cursor = replica.cursor(query, fields) if replica else None
+        if cursor is not None:
+            return cursor
+        cursors = []
+        for shard_db in cls.route(db, query):
+            cursor = shard_db[c].find(query, fields) if fields \
+                else shard_db[c].find(query)
+            if deadline is not None:
+                cursor = deadline.limit(cursor)
+            cursors.append(cursor)
+        if len(cursors) > 1:
+            if near_fields(query):
+                raise ValueError("near query of '{0}' needs shard key '{1}'"
+                                 .format(cls.__name__, cls.SHARD_KEY))
+            return ScatterCursor(cursors)
+        return cursors[0]
 
     @classmethod
     @gen.coroutine
-    def find(cls, cursor, model=True, list_len=None):
+    def find(cls, cursor, model=True, list_len=None, deadline=None):
         """
         Returns a list of found documents.
 
         :arg cursor: motor cursor for find
-        :arg model: if True, then construct model instance for each document.
+        :arg model: if True, then construct model instance for each document,
+            if 'record', then read-only record of `get_record_class`.
             Otherwise, just leave them as list of dicts.
         :arg list_len: list of documents to be returned.
+        :arg deadline: `Deadline` of the request, server side execution
+            time of the cursor is limited to the remaining time.
 
         Example:
             cursor = ExampleModel.get_cursor(self.db, {"first_name": "Hello"})
@@ -310,13 +717,28 @@ class BaseModel(Model):
         list_len = list_len or cls.find_list_len() or MAX_FIND_LIST_LEN
         for i in cls.reconnect_amount():
             try:
-                result = yield motor.Op(cursor.to_list, list_len)
+                if isinstance(cursor, ReplicaCursor):
+                    result = cursor.fetch(list_len)
+                elif isinstance(cursor, ScatterCursor):
+                    results = yield cls.scatter([
+                        partial(cls.run_op, shard_cursor.to_list,
+                                cursor.window(list_len), deadline=deadline)
+                        for shard_cursor in cursor.shard_cursors()
+                    ], deadline)
+                    result = cursor.merge(results, list_len)
+                else:
+                    result = yield cls.run_op(
+                        cursor.to_list, list_len, deadline=deadline)
             except ConnectionFailure as e:
-                exceed = yield cls.check_reconnect_tries_and_wait(i, 'find')
+                exceed = yield cls.check_reconnect_tries_and_wait(
+                    i, 'find', deadline)
                 if exceed:
                     raise e
             else:
-                if model:
+                if model == 'record':
+                    record_class = cls.get_record_class()
+                    result = [record_class(document) for document in result]
+                elif model:
                     field_names_set = set(cls._fields.keys())
                     for i in xrange(len(result)):
                         result[i] = cls.make_model(
@@ -325,14 +747,26 @@ class BaseModel(Model):
 
     @classmethod
     @gen.coroutine
-    def count(cls, cursor, model=True):
+    def count(cls, cursor, model=True, deadline=None):
         result = None
+        if isinstance(cursor, ReplicaCursor):
+            raise gen.Return(cursor.count())
 
         for i in cls.reconnect_amount():
             try:
-                result = yield motor.Op(cursor.count)
+                if isinstance(cursor, ScatterCursor):
+                    results = yield cls.scatter([
+                        partial(cls.run_op, shard_cursor.count,
+                                deadline=deadline)
+                        for shard_cursor in cursor.cursors
+                    ], deadline)
+                    result = sum(results)
+                else:
+                    result = yield cls.run_op(
+                        cursor.count, deadline=deadline)
             except ConnectionFailure as e:
-                exceed = yield cls.check_reconnect_tries_and_wait(i, 'count')
+                exceed = yield cls.check_reconnect_tries_and_wait(
+                    i, 'count', deadline)
                 if exceed:
                     raise e
             else:
@@ -340,31 +774,197 @@ class BaseModel(Model):
 
     @classmethod
     @gen.coroutine
-    def aggregate(cls, db, pipe_list, collection=None):
+    def aggregate(cls, db, pipe_list, collection=None, deadline=None):
+        """
+        Runs the pipeline. Pipelines of sharded models which don't start
+        with `$match` by the shard key run on every shard, the groups of
+        the shards are merged by `_id` and the trailing `$sort`, `$skip`
+        and `$limit` are applied to the merged documents, see
+        `split_pipeline`. Raises `ValueError` if such a pipeline can't be
+        merged.
+        """
         c = cls.check_collection(collection)
+        match = pipe_list[0].get('$match') if pipe_list else None
+        shards = cls.route(db, match)
+        if len(shards) == 1:
+            result = yield cls._aggregate_in(shards[0], c, pipe_list, deadline)
+            raise gen.Return(result)
+        shard_pipe, group, tail = split_pipeline(pipe_list)
+        results = yield cls.scatter([
+            partial(cls._aggregate_in, shard_db, c, shard_pipe, deadline)
+            for shard_db in shards
+        ], deadline)
+        raise gen.Return({"ok": 1.0, "result": merge_aggregation(
+            group, tail, [shard_result.get('result', [])
+                          if isinstance(shard_result, dict) else shard_result
+                          for shard_result in results])})
+
+    @classmethod
+    @gen.coroutine
+    def _aggregate_in(cls, db, c, pipe_list, deadline, gated=True):
+        kwargs = {}
+        if deadline is not None and SERVER_TIME_LIMITS:
+            kwargs['maxTimeMS'] = deadline.max_time_ms()
         for i in cls.reconnect_amount():
             try:
-                result = yield motor.Op(db[c].aggregate, pipe_list)
+                result = yield cls.run_op(
+                    db[c].aggregate, pipe_list, deadline=deadline,
+                    gated=gated, **kwargs)
             except ConnectionFailure as e:
                 exceed = yield cls.check_reconnect_tries_and_wait(
                     i,
-                    'aggregate')
+                    'aggregate', deadline)
                 if exceed:
                     raise e
             else:
                 raise gen.Return(result)
 
+    @classmethod
+    @gen.coroutine
+    def aggregate_list(cls, db, pipe_list, collection=None, deadline=None):
+        """
+        Runs `aggregate` and returns the list of resulting documents.
+        """
+        result = yield cls.aggregate(db, pipe_list, collection, deadline)
+        if isinstance(result, dict):
+            result = result.get('result', [])
+        raise gen.Return(result)
+
+    @classmethod
+    def get_replica(cls, collection=None):
+        """
+        Returns loaded in memory replica of the model collection, if the
+        model is declared with `IN_MEMORY`.
+        """
+        if collection and collection != cls.get_collection():
+            return None
+        replica = get_replica(cls)
+        if replica is None or not replica.loaded:
+            return None
+        return replica
+
+    @classmethod
+    @gen.coroutine
+    def load_replica(cls, db):
+        """
+        Loads `IN_MEMORY` model collection and starts periodic refresh.
+        """
+        replica = get_replica(cls)
+        if replica is not None:
+            yield replica.start(db)
+
+    @classmethod
+    @gen.coroutine
+    def notify_write(cls, db, collection=None, _id=None):
+        """
+        Evicts cached entries of the changed document (or the whole
+        collection if `_id` is not known or is a condition), marks in
+        memory replicas of the collection stale and tells other nodes
+        through the invalidation bus.
+        """
+        c = cls.check_collection(collection)
+        if isinstance(_id, dict):
+            _id = None
+        cache.invalidate(c, _id)
+        for replica in replicas_of(c):
+            replica.changed()
+        bus = get_bus()
+        if bus is not None:
+            yield bus.publish(c, _id)
+
+    @classmethod
+    def get_ops_gate(cls):
+        """
+        Returns the gate limiting concurrent mongo operations of the model,
+        configured with `MAX_IN_FLIGHT_OPS`, `MAX_QUEUED_OPS` and
+        `OPS_QUEUE_TIMEOUT`. No limit is applied if `MAX_IN_FLIGHT_OPS`
+        is not set.
+        """
+        max_in_flight = getattr(cls, 'MAX_IN_FLIGHT_OPS', None)
+        if not max_in_flight:
+            return None
+        return get_gate(
+            'model.{0}'.format(cls.__name__),
+            max_in_flight,
+            getattr(cls, 'MAX_QUEUED_OPS', 0),
+            getattr(cls, 'OPS_QUEUE_TIMEOUT', 1))
+
+    @classmethod
+    @gen.coroutine
+    def scatter(cls, calls, deadline=None):
+        """
+        Runs `calls`, functions taking `gated` keyword argument and
+        returning futures, concurrently and returns their results. The
+        operations of a scatter over several shards share one slot of the
+        model gate, so a scatter doesn't shed its own operations.
+        """
+        if len(calls) == 1:
+            result = yield calls[0](gated=True)
+            raise gen.Return([result])
+        if deadline is not None:
+            deadline.check()
+        gate = cls.get_ops_gate()
+        if gate is not None:
+            yield gate.acquire(deadline)
+        try:
+            results = yield [call(gated=False) for call in calls]
+        finally:
+            if gate is not None:
+                gate.release()
+        raise gen.Return(results)
+
+    @classmethod
+    @gen.coroutine
+    def run_op(cls, func, *args, **kwargs):
+        """
+        Runs motor operation, waiting for a free slot of the model gate
+        unless `gated` keyword argument is False. Raises `Overloaded` if
+        the operation is shed and `DeadlineExceeded` if the `deadline`
+        keyword argument is over before the operation completes.
+        """
+        deadline = kwargs.pop('deadline', None)
+        gated = kwargs.pop('gated', True)
+        if deadline is not None:
+            deadline.check()
+        gate = cls.get_ops_gate() if gated else None
+        if gate is not None:
+            yield gate.acquire(deadline)
+        profile = current_profile()
+        try:
+            if deadline is not None:
+                deadline.check()
+            if profile is None:
+                result = yield motor.Op(func, *args, **kwargs)
+            else:
+                started = time.time()
+                try:
+                    result = yield motor.Op(func, *args, **kwargs)
+                finally:
+                    profile.add_wait('{0}.{1}'.format(
+                        cls.__name__, getattr(func, '__name__', 'op')),
+                        time.time() - started)
+        except ExecutionTimeout:
+            raise DeadlineExceeded()
+        finally:
+            if gate is not None:
+                gate.release()
+        raise gen.Return(result)
+
     @staticmethod
     def reconnect_amount():
         return xrange(options.mongodb_reconnect_retries + 1)
 
     @classmethod
     @gen.coroutine
-    def check_reconnect_tries_and_wait(cls, reconnect_number, func_name):
+    def check_reconnect_tries_and_wait(cls, reconnect_number, func_name,
+                                       deadline=None):
         if reconnect_number >= options.mongodb_reconnect_retries:
             raise gen.Return(True)
         else:
             timeout = options.mongodb_reconnect_timeout
+            if deadline is not None:
+                deadline.check()
+                timeout = min(timeout, deadline.remaining())
             l.warning(
                 "ConnectionFailure #{0} in {1}.{2}. Waiting {3} seconds"
                 .format(
@@ -378,6 +978,23 @@ class BaseModel(Model):
             del data['_id']
         return data
 
+    @classmethod
+    def get_record_class(cls):
+        """
+        Returns `__slots__` record class with the fields of the model,
+        generated once per class.
+        """
+        record_class = cls.__dict__.get('_record_class')
+        if record_class is None:
+            record_class = cls._record_class = make_record_class(cls)
+        return record_class
+
+    @classmethod
+    def make_result(cls, data, model, method_name):
+        if model == 'record':
+            return cls.get_record_class()(data)
+        return cls.make_model(data, method_name)
+
     @classmethod
     def make_model(cls, data, method_name, field_names_set=None):
         """
@@ -402,3 +1019,18 @@ class BaseModel(Model):
 class OnlyIdModel(BaseModel):
     _id = ObjectIdType()
 
+
+def iter_models(base=BaseModel):
+    """
+    Yields all imported model classes with a collection.
+    """
+    seen = set()
+    stack = list(base.__subclasses__())
+    while stack:
+        model = stack.pop()
+        if model in seen:
+            continue
+        seen.add(model)
+        stack.extend(model.__subclasses__())
+        if model.get_collection():
+            yield model
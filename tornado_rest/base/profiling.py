@@ -0,0 +1,244 @@
+import atexit
+import contextlib
+import cProfile
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections import deque
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+l = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile"
+
+_current = None
+
+
+def current_profile():
+    """
+    Returns profile of the request whose callback is running now.
+    """
+    return _current
+
+
+def label(func):
+    filename, line, name = func
+    if filename == '~':
+        return name
+    return '{0}:{1}:{2}'.format(os.path.basename(filename), line, name)
+
+
+def collapse(stats, min_share=0.0001, max_depth=64):
+    """
+    Turns `pstats` data into collapsed stacks ("a;b;c time"), splitting
+    time of functions called from several places by the share of calls.
+    """
+    children = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+    stacks = {}
+
+    def walk(func, path, names, share):
+        tt = stats[func][2]
+        names = names + [label(func)]
+        if tt * share > 0:
+            key = ';'.join(names)
+            stacks[key] = stacks.get(key, 0) + tt * share
+        if len(names) >= max_depth:
+            return
+        for child, edge_ct in children.get(func, ()):
+            child_ct = stats[child][3]
+            if child in path or not child_ct:
+                continue
+            child_share = share * edge_ct / child_ct
+            if child_share >= min_share:
+                walk(child, path | set([child]), names, child_share)
+
+    for func, (_, _, _, _, callers) in stats.items():
+        if not callers:
+            walk(func, set([func]), [], 1.0)
+    return stacks
+
+
+class Profile(object):
+    """
+    cProfile of one request, enabled only while callbacks of the request
+    run, plus wall time spent waiting for each mongo operation.
+    """
+
+    def __init__(self, request, handler_name):
+        self.id = uuid.uuid4().hex
+        self.method = request.method
+        self.path = request.path
+        self.handler = handler_name
+        self.started = time.time()
+        self.duration_ms = None
+        self.waits = {}
+        self.stacks = None
+        self.cpu_ms = None
+        self.finished = False
+        self._profiler = cProfile.Profile()
+
+    @contextlib.contextmanager
+    def active(self):
+        global _current
+        if self.finished:
+            # callbacks of the request may still run after on_finish
+            yield
+            return
+        previous = _current
+        if previous is not None:
+            previous.pause()
+        _current = self
+        self._profiler.enable()
+        try:
+            yield
+        finally:
+            _current = previous
+            self.pause()
+            if previous is not None:
+                previous.resume()
+
+    def pause(self):
+        if not self.finished:
+            self._profiler.disable()
+
+    def resume(self):
+        if not self.finished:
+            self._profiler.enable()
+
+    def add_wait(self, name, elapsed):
+        count, total = self.waits.get(name, (0, 0))
+        self.waits[name] = (count + 1, total + elapsed)
+
+    def finish(self):
+        # usually called from on_finish, inside of `active`
+        self.pause()
+        self.finished = True
+        self.duration_ms = (time.time() - self.started) * 1000
+        stacks = collapse(pstats.Stats(self._profiler).stats)
+        self.cpu_ms = sum(stacks.values()) * 1000
+        for name, (count, total) in self.waits.items():
+            key = '{0};motor.Op;{1}'.format(self.handler, name)
+            stacks[key] = stacks.get(key, 0) + total
+        self.stacks = stacks
+        self._profiler = None
+
+    def collapsed(self):
+        """
+        Returns stacks in the format of flamegraph.pl, weights are in
+        microseconds.
+        """
+        return ''.join(
+            '{0} {1}\n'.format(stack, int(round(seconds * 1000000)))
+            for stack, seconds in sorted(self.stacks.items()))
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "handler": self.handler,
+            "started": self.started,
+            "duration_ms": self.duration_ms,
+            "cpu_ms": self.cpu_ms,
+            "mongo_ms": self.mongo_ms(),
+            "mongo_ops": dict((name, count) for name, (count, _)
+                              in self.waits.items()),
+        }
+
+    def mongo_ms(self):
+        return sum(total for _, total in self.waits.values()) * 1000
+
+
+class Profiler(object):
+    """
+    Profiles requests to `BaseHandler` carrying the `X-Profile: <secret>`
+    header and a random `sample_rate` share of the others. Enabled with
+    the `profiler` application setting:
+
+        Application(urls, db=db, profiler=Profiler(secret="s3cret"))
+
+    Recent profiles are served by `ProfilesHandler`, and written as
+    `<id>.collapsed` files into `directory` if it is given. Files are
+    written by a writer thread, so requests never wait for the disk.
+    """
+
+    def __init__(self, secret=None, sample_rate=0, max_profiles=50,
+                 directory=None):
+        self.secret = secret
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.profiles = deque(maxlen=max_profiles)
+        self._queue = Queue()
+        self._writer = None
+        atexit.register(self.close)
+
+    def wants(self, request):
+        if self.secret and \
+                request.headers.get(PROFILE_HEADER) == self.secret:
+            return True
+        return bool(self.sample_rate) and random.random() < self.sample_rate
+
+    def start(self, request, handler_name):
+        return Profile(request, handler_name)
+
+    def finish(self, profile):
+        profile.finish()
+        self.profiles.append(profile)
+        if self.directory:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_files)
+                self._writer.daemon = True
+                self._writer.start()
+            self._queue.put(profile)
+
+    def flush(self):
+        """
+        Waits until files of the profiles finished so far are written.
+        """
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self):
+        """
+        Writes files left and stops the writer thread.
+        """
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(None)
+            writer.join()
+
+    def _write_files(self):
+        while True:
+            profile = self._queue.get()
+            try:
+                if profile is None:
+                    return
+                self._write(profile)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, profile):
+        path = os.path.join(
+            self.directory, '{0}.collapsed'.format(profile.id))
+        try:
+            with open(path, 'w') as f:
+                f.write(profile.collapsed())
+        except IOError:
+            l.exception("Profile is not written to {0}".format(path))
+
+    def get(self, profile_id):
+        for profile in self.profiles:
+            if profile.id == profile_id:
+                return profile
+        return None
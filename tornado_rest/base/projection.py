@@ -0,0 +1,39 @@
+from bson.objectid import ObjectId
+
+
+def projected_names(read_fields, projection):
+    """
+    Returns names of visible fields documents fetched with `projection`
+    have, `_id` is kept unless it is excluded.
+    """
+    if any(projection.values()):
+        names = [name for name in read_fields if projection.get(name)]
+        if '_id' in read_fields and '_id' not in names and \
+                projection.get('_id', 1):
+            names.append('_id')
+        return names
+    return [name for name in read_fields if name not in projection]
+
+
+class ProjectionSerializer(object):
+    """
+    Serializes documents fetched with a projection straight from the
+    dict, converting only the projected fields the way the model would,
+    without building the model.
+    """
+
+    def __init__(self, model, names):
+        self.model = model
+        self.names = names
+        self.fields = [(name, model._fields[name]) for name in names]
+
+    def to_json(self, document):
+        result = {}
+        for name, field in self.fields:
+            value = document.get(name)
+            if value is not None:
+                value = field.to_primitive(field.to_native(value))
+            result[name] = value
+        if isinstance(result.get('_id'), ObjectId):
+            result['_id'] = str(result['_id'])
+        return result
@@ -0,0 +1,150 @@
+from collections import namedtuple
+
+DEFAULT_SORT = [("_id", 1)]
+DEFAULT_LIMIT = 20
+# name of the projected relevance, models must not declare it
+TEXT_SCORE = "_score"
+TEXT_SCORE_META = {"$meta": "textScore"}
+
+
+def near_fields(query):
+    """
+    Returns fields of the query with `$near` or `$nearSphere` condition.
+    """
+    return [field for field, condition in query.items()
+            if isinstance(condition, dict) and
+            ("$near" in condition or "$nearSphere" in condition)]
+
+
+class InvalidQuery(Exception):
+    def __init__(self, errors):
+        super(InvalidQuery, self).__init__(errors)
+        self.errors = errors
+
+
+class QuerySpec(namedtuple('QuerySpec', 'query sort fields skip limit')):
+    """
+    Read query of a request. Specs are never changed in place, every
+    method returns a new spec, so mixins build it in one pass:
+
+        spec = QuerySpec().filter({"age": {"$gte": 18}}).paginate(20, 20)
+        cursor = spec.get_cursor(db, UserModel)
+    """
+    __slots__ = ()
+
+    def __new__(cls, query=None, sort=None, fields=None, skip=0,
+                limit=DEFAULT_LIMIT):
+        return super(QuerySpec, cls).__new__(
+            cls, query or {}, list(sort or DEFAULT_SORT), fields or {},
+            skip, limit)
+
+    def filter(self, conditions):
+        query = dict(self.query)
+        query.update(conditions)
+        return self._replace(query=query)
+
+    def where(self, query):
+        return self._replace(query=dict(query))
+
+    def order_by(self, sort):
+        return self._replace(sort=list(sort))
+
+    def project(self, fields):
+        fields = dict(fields)
+        for name in self.meta_fields():
+            fields.setdefault(name, self.fields[name])
+        return self._replace(fields=fields)
+
+    def merge_projection(self, fields):
+        """
+        Merges `$only` ({name: 1}) or `$exclude` ({name: 0}) fields into
+        the projection, in any order: excluded fields are removed from an
+        inclusive projection.
+        """
+        meta = dict((name, value) for name, value in self.fields.items()
+                    if isinstance(value, dict))
+        plain = [(name, value) for name, value in self.fields.items()
+                 if name not in meta] + list(fields.items())
+        included = set(name for name, value in plain if value)
+        excluded = set(name for name, value in plain if not value)
+        if included:
+            kept = included - excluded
+            projection = dict((name, 1) for name in kept)
+            if '_id' in excluded:
+                projection['_id'] = 0
+            if not kept:
+                projection = {'_id': 1}
+        else:
+            projection = dict((name, 0) for name in excluded)
+        projection.update(meta)
+        return self._replace(fields=projection)
+
+    def projection(self):
+        """
+        Returns the projection without computed fields.
+        """
+        return dict((name, value) for name, value in self.fields.items()
+                    if not isinstance(value, dict))
+
+    def search(self, text):
+        """
+        Adds full text search condition and projects relevance score.
+        """
+        spec = self.filter({"$text": {"$search": text}})
+        fields = dict(spec.fields)
+        fields[TEXT_SCORE] = TEXT_SCORE_META
+        return spec._replace(fields=fields)
+
+    def meta_fields(self):
+        """
+        Returns names of computed fields projected with `$meta`.
+        """
+        return [name for name, value in self.fields.items()
+                if isinstance(value, dict)]
+
+    def paginate(self, skip, limit):
+        return self._replace(skip=skip, limit=limit)
+
+    def validate(self, model):
+        """
+        Raises `InvalidQuery` if the spec refers to fields which are not
+        declared by the model.
+        """
+        allowed = set(model._fields.keys())
+        meta_fields = self.meta_fields()
+        errors = []
+        for field in self.query:
+            if not field.startswith('$') and field not in allowed:
+                errors.append("Unknown filter field '{0}'".format(field))
+        for field, direction in self.sort:
+            if isinstance(direction, dict):
+                if field not in meta_fields:
+                    errors.append(
+                        "'{0}' sort is only allowed with $search"
+                        .format(field))
+            elif field not in allowed:
+                errors.append("Unknown sort field '{0}'".format(field))
+        for field in self.fields:
+            if field not in allowed and field not in meta_fields:
+                errors.append("Unknown field '{0}'".format(field))
+        if near_fields(self.query) and model.is_scattered(self.query):
+            # shards return documents by distance each, not globally
+            errors.append("near filter needs '{0}' filter".format(
+                model.SHARD_KEY))
+        if self.skip < 0 or self.limit < 0:
+            errors.append("Negative page or display")
+        elif self.limit == 0:
+            errors.append("Display must be positive")
+        if errors:
+            raise InvalidQuery(errors)
+
+    def get_cursor(self, db, model, deadline=None):
+        cursor = model.get_cursor(
+            db,
+            query=self.query,
+            fields=self.fields,
+            deadline=deadline
+        )
+        if self.sort:
+            cursor = cursor.sort(self.sort)
+        return cursor.skip(self.skip).limit(self.limit)
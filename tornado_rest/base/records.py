@@ -0,0 +1,45 @@
+class BaseRecord(object):
+    """
+    Read-only document with a slot per declared field of the model and no
+    per-instance dict. Values are kept as they are stored in mongo,
+    `to_model` builds the full model for writes.
+    """
+    __slots__ = ()
+    _model = None
+
+    def __init__(self, data):
+        for name in self.__slots__:
+            object.__setattr__(self, name, data.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("'{0}' is read-only".format(
+            self.__class__.__name__))
+
+    def __getitem__(self, name):
+        if name not in self.__slots__:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __repr__(self):
+        return '<{0}: {1}>'.format(self.__class__.__name__, self._id) \
+            if '_id' in self.__slots__ else \
+            '<{0}>'.format(self.__class__.__name__)
+
+    def to_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def to_json(self):
+        return self._model.get_serializer().to_json(self.to_dict())
+
+    def to_model(self):
+        return self._model.make_model(self.to_dict(), "to_model")
+
+
+def make_record_class(model):
+    """
+    Generates record class with the fields of the model.
+    """
+    return type(
+        '{0}Record'.format(model.__name__),
+        (BaseRecord,),
+        {'__slots__': tuple(model._fields), '_model': model})
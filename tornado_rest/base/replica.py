@@ -0,0 +1,306 @@
+import copy
+import logging
+import numbers
+import operator
+from tornado import gen, ioloop
+
+l = logging.getLogger(__name__)
+
+MAX_REPLICA_LEN = 10000
+
+
+def bracket(value):
+    """
+    Returns type bracket of the value, mongo comparison operators only
+    match values of the same bracket: `{"$lt": "10"}` doesn't match 5 and
+    `{"$lt": 5}` doesn't match null.
+    """
+    if isinstance(value, bool):
+        return bool
+    if isinstance(value, numbers.Number):
+        return numbers.Number
+    if isinstance(value, basestring):
+        return basestring
+    return type(value)
+
+
+def comparison(op):
+    def match(value, arg):
+        if isinstance(value, list):
+            return any(match(item, arg) for item in value)
+        return bracket(value) is bracket(arg) and op(value, arg)
+    return match
+
+
+OPERATORS = {
+    '$lt': comparison(operator.lt),
+    '$lte': comparison(operator.le),
+    '$gt': comparison(operator.gt),
+    '$gte': comparison(operator.ge),
+    '$ne': operator.ne,
+    '$in': lambda value, arg: value in arg,
+    '$nin': lambda value, arg: value not in arg,
+}
+
+_replicas = {}
+
+
+def is_operator_dict(condition):
+    return isinstance(condition, dict) and condition and \
+        all(key.startswith('$') for key in condition)
+
+
+def supports_query(query):
+    for field, condition in query.items():
+        if field.startswith('$') or '.' in field:
+            return False
+        if is_operator_dict(condition) and \
+                any(op not in OPERATORS for op in condition):
+            return False
+    return True
+
+
+def match_condition(value, condition):
+    if is_operator_dict(condition):
+        for op, arg in condition.items():
+            if isinstance(value, list) and op in ('$in', '$nin'):
+                found = any(item in arg for item in value)
+                if found != (op == '$in'):
+                    return False
+            elif not OPERATORS[op](value, arg):
+                return False
+        return True
+    if isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+    return value == condition
+
+
+def matches(document, query):
+    for field, condition in query.items():
+        if not match_condition(document.get(field), condition):
+            return False
+    return True
+
+
+def slice_list(value, arg):
+    if isinstance(arg, list):
+        skip, limit = arg
+        if skip < 0:
+            skip = max(len(value) + skip, 0)
+        return value[skip:skip + limit]
+    return value[:arg] if arg >= 0 else value[arg:]
+
+
+def project(document, fields):
+    if not fields:
+        return document
+    slices = dict((name, spec['$slice']) for name, spec in fields.items()
+                  if isinstance(spec, dict) and '$slice' in spec)
+    plain = dict((name, spec) for name, spec in fields.items()
+                 if name not in slices)
+    if any(spec for name, spec in plain.items() if name != '_id'):
+        result = dict((name, document[name]) for name in plain
+                      if plain[name] and name in document)
+        for name in slices:
+            if name in document:
+                result[name] = document[name]
+        if plain.get('_id', 1) and '_id' in document:
+            result['_id'] = document['_id']
+    else:
+        result = dict((name, value) for name, value in document.items()
+                      if not (name in plain and not plain[name]))
+    for name, arg in slices.items():
+        if isinstance(result.get(name), list):
+            result[name] = slice_list(result[name], arg)
+    return result
+
+
+class ReplicaCursor(object):
+    """
+    Cursor over documents of a replica, supports the part of motor cursor
+    interface used by `BaseModel`.
+    """
+
+    def __init__(self, documents, fields=None):
+        self._documents = documents
+        self._fields = fields
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=1):
+        if isinstance(key_or_list, list):
+            self._sort = key_or_list
+        else:
+            self._sort = [(key_or_list, direction)]
+        return self
+
+    def skip(self, skip):
+        self._skip = skip
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def max_time_ms(self, max_time_ms):
+        return self
+
+    def count(self):
+        return len(self._documents)
+
+    def fetch(self, length):
+        documents = list(self._documents)
+        for field, direction in reversed(self._sort or []):
+            documents.sort(key=lambda doc: doc.get(field),
+                           reverse=direction < 0)
+        end = len(documents)
+        if self._limit:
+            end = min(end, self._skip + abs(self._limit))
+        end = min(end, self._skip + length)
+        return [copy.deepcopy(project(doc, self._fields))
+                for doc in documents[self._skip:end]]
+
+
+class Replica(object):
+    """
+    In memory copy of a small collection, indexed by `_id` and the
+    declared keys.
+    """
+
+    def __init__(self, model, keys=(), refresh=None):
+        self.model = model
+        self.keys = list(keys)
+        self.refresh = refresh
+        self.loaded = False
+        self._documents = []
+        self._by_id = {}
+        self._indexes = {}
+        self._periodic = None
+        self._db = None
+        self._version = 0
+        self._reloading = False
+
+    @gen.coroutine
+    def load(self, db):
+        """
+        Loads the collection. Collections of more than `MAX_REPLICA_LEN`
+        documents are not kept, and a load the collection changed during
+        is dropped, reads go to mongo in both cases.
+        """
+        version = self._version
+        cursor = db[self.model.get_collection()].find()
+        documents = yield self.model.run_op(
+            cursor.to_list, MAX_REPLICA_LEN + 1)
+        if len(documents) > MAX_REPLICA_LEN:
+            l.warning("'{0}' has more than {1} documents, it is not kept "
+                      "in memory".format(self.model.__name__,
+                                         MAX_REPLICA_LEN))
+            self._rebuild([])
+            self.loaded = False
+        elif version == self._version:
+            self._rebuild(documents)
+
+    def start(self, db):
+        """
+        Loads the replica and keeps it refreshed every `refresh` seconds.
+        """
+        self._db = db
+        if self.refresh and self._periodic is None:
+            self._periodic = ioloop.PeriodicCallback(
+                lambda: self.load(db), self.refresh * 1000)
+            self._periodic.start()
+        return self.load(db)
+
+    def changed(self):
+        """
+        Marks started replica as stale after the collection has been
+        changed, reads go to mongo until it is reloaded in the background.
+        """
+        if self._db is None:
+            return
+        self._version += 1
+        self.loaded = False
+        if not self._reloading:
+            self._reloading = True
+            ioloop.IOLoop.current().add_callback(self._reload)
+
+    @gen.coroutine
+    def _reload(self):
+        try:
+            version = None
+            while version != self._version:
+                version = self._version
+                yield self.load(self._db)
+        except Exception:
+            l.exception("'{0}' replica is not reloaded"
+                        .format(self.model.__name__))
+        finally:
+            self._reloading = False
+
+    def stop(self):
+        if self._periodic is not None:
+            self._periodic.stop()
+            self._periodic = None
+
+    def _rebuild(self, documents):
+        by_id = {}
+        indexes = dict((key, {}) for key in self.keys)
+        for document in documents:
+            by_id[document.get('_id')] = document
+            for key in self.keys:
+                value = document.get(key)
+                try:
+                    indexes[key].setdefault(value, []).append(document)
+                except TypeError:
+                    pass
+        self._documents, self._by_id, self._indexes = \
+            documents, by_id, indexes
+        self.loaded = True
+
+    def candidates(self, query):
+        _id = query.get('_id')
+        if '_id' in query and not isinstance(_id, dict):
+            document = self._by_id.get(_id)
+            return [document] if document is not None else []
+        for key in self.keys:
+            value = query.get(key)
+            if key in query and not isinstance(value, (dict, list)):
+                return self._indexes[key].get(value, [])
+        return self._documents
+
+    def find(self, query):
+        """
+        Returns matching documents or None if the query can't be answered
+        from memory.
+        """
+        if not self.loaded or not supports_query(query):
+            return None
+        return [document for document in self.candidates(query)
+                if matches(document, query)]
+
+    def cursor(self, query, fields=None):
+        documents = self.find(query)
+        if documents is None:
+            return None
+        return ReplicaCursor(documents, fields)
+
+
+def get_replica(model):
+    """
+    Returns replica of the model if it is declared with `IN_MEMORY`.
+    """
+    if not getattr(model, 'IN_MEMORY', False):
+        return None
+    replica = _replicas.get(model)
+    if replica is None:
+        replica = _replicas[model] = Replica(
+            model,
+            getattr(model, 'IN_MEMORY_KEYS', ()),
+            getattr(model, 'IN_MEMORY_REFRESH', None))
+    return replica
+
+
+def replicas_of(collection):
+    return [replica for model, replica in _replicas.items()
+            if model.get_collection() == collection]
@@ -0,0 +1,206 @@
+import json
+import zlib
+from bson import json_util
+
+_connections = {}
+
+
+def register_connection(name, db):
+    """
+    Registers database handle of a shard under the name used in
+    `SHARDS` of the models.
+    """
+    _connections[name] = db
+
+
+def get_connection(name):
+    try:
+        return _connections[name]
+    except KeyError:
+        raise ValueError("Shard connection '{0}' is not registered"
+                         .format(name))
+
+
+def is_connection(db):
+    return any(db is connection for connection in _connections.values())
+
+
+def shard_for(value, shards):
+    """
+    Returns name of the shard holding documents with given shard key
+    value. The hash is stable between processes and restarts.
+    """
+    key = u'{0}'.format(value).encode('utf-8')
+    return shards[(zlib.crc32(key) & 0xffffffff) % len(shards)]
+
+
+class ScatterCursor(object):
+    """
+    Cursor over the same query sent to several shards. Each shard returns
+    at most `skip + limit` sorted documents, which are merged and then
+    skipped and limited once more.
+    """
+
+    def __init__(self, cursors):
+        self.cursors = cursors
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=1):
+        if isinstance(key_or_list, list):
+            self._sort = key_or_list
+        else:
+            self._sort = [(key_or_list, direction)]
+        return self
+
+    def skip(self, skip):
+        self._skip = skip
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def max_time_ms(self, max_time_ms):
+        for cursor in self.cursors:
+            cursor.max_time_ms(max_time_ms)
+        return self
+
+    def explain(self, callback):
+        return self.cursors[0].explain(callback=callback)
+
+    def window(self, length):
+        if self._limit:
+            length = min(length, abs(self._limit))
+        return self._skip + length
+
+    def shard_cursors(self):
+        for cursor in self.cursors:
+            if self._sort:
+                cursor = cursor.sort(self._sort)
+            yield cursor
+
+    def merge(self, results, length):
+        documents = [document for result in results for document in result]
+        for field, direction in reversed(self._sort or []):
+            # {"$meta": "textScore"} sorts by descending score
+            descending = isinstance(direction, dict) or direction < 0
+            documents.sort(key=lambda doc: doc.get(field),
+                           reverse=descending)
+        return documents[self._skip:self.window(length)]
+
+
+# accumulators of `$group` which can be merged across shards
+MERGED_ACCUMULATORS = ("$sum", "$min", "$max", "$avg")
+TAIL_STAGES = ("$sort", "$skip", "$limit")
+AVG_COUNT = "{0}__avg_count"
+
+
+def stage_name(stage):
+    return next(iter(stage))
+
+
+def split_pipeline(pipe_list):
+    """
+    Splits pipeline run on several shards into the stages sent to every
+    shard, the `$group` (or None) which merges the groups of the shards
+    by `_id` and the trailing `$sort`, `$skip` and `$limit` stages which
+    are applied once more to the merged documents. `$avg` is sent as a
+    sum and a count of not null values. Raises `ValueError` if the
+    results of the shards can't be merged.
+    """
+    tail_start = len(pipe_list)
+    while tail_start and \
+            stage_name(pipe_list[tail_start - 1]) in TAIL_STAGES:
+        tail_start -= 1
+    head, tail = list(pipe_list[:tail_start]), list(pipe_list[tail_start:])
+    names = [stage_name(stage) for stage in head]
+    if '$skip' in names or '$limit' in names:
+        raise ValueError("$skip and $limit can't be run on several shards "
+                         "before the last stages")
+    if '$group' not in names:
+        return head, None, tail
+    if names.count('$group') > 1 or names[-1] != '$group':
+        raise ValueError("Only the last $group can be merged across shards")
+    group = head[-1]['$group']
+    shard_group = {}
+    for name, accumulator in group.items():
+        if name == '_id':
+            shard_group[name] = accumulator
+            continue
+        (op, expression), = accumulator.items()
+        if op not in MERGED_ACCUMULATORS:
+            raise ValueError("{0} of {1} can't be merged across shards"
+                             .format(op, name))
+        if op == '$avg':
+            shard_group[name] = {'$sum': expression}
+            shard_group[AVG_COUNT.format(name)] = {'$sum': {'$cond': [
+                {'$eq': [{'$ifNull': [expression, None]}, None]}, 0, 1]}}
+        else:
+            shard_group[name] = accumulator
+    head[-1] = {'$group': shard_group}
+    return head, group, tail
+
+
+def merge_groups(group, documents):
+    merged = {}
+    for document in documents:
+        key = json.dumps(document['_id'], sort_keys=True,
+                         default=json_util.default)
+        if key not in merged:
+            merged[key] = document
+            continue
+        target = merged[key]
+        for name, accumulator in group.items():
+            if name == '_id':
+                continue
+            op = stage_name(accumulator)
+            if op == '$avg':
+                count = AVG_COUNT.format(name)
+                target[count] += document[count]
+                op = '$sum'
+            value = document.get(name)
+            if op == '$sum':
+                target[name] += value
+            elif value is not None and (
+                    target.get(name) is None or
+                    (value < target[name]) == (op == '$min')):
+                target[name] = value
+    result = list(merged.values())
+    for document in result:
+        for name, accumulator in group.items():
+            if name != '_id' and stage_name(accumulator) == '$avg':
+                count = document.pop(AVG_COUNT.format(name))
+                document[name] = float(document[name]) / count \
+                    if count else None
+    return result
+
+
+def get_path(document, path):
+    for key in path.split('.'):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(key)
+    return document
+
+
+def merge_aggregation(group, tail, results):
+    """
+    Merges documents the shards returned for a pipeline split with
+    `split_pipeline`.
+    """
+    documents = [document for result in results for document in result]
+    if group is not None:
+        documents = merge_groups(group, documents)
+    for stage in tail:
+        name, value = next(iter(stage.items()))
+        if name == '$sort':
+            for field, direction in reversed(list(value.items())):
+                documents.sort(key=lambda doc: get_path(doc, field),
+                               reverse=direction < 0)
+        elif name == '$skip':
+            documents = documents[value:]
+        else:
+            documents = documents[:value]
+    return documents
@@ -0,0 +1,84 @@
+from schematics.exceptions import ConversionError, ValidationError
+from schematics.exceptions import ModelConversionError
+from schematics.models import Model
+
+REQUIRED_MESSAGE = u"This field is required."
+ROGUE_MESSAGE = u"Rogue field"
+
+
+def error_messages(error):
+    return getattr(error, 'messages', None) or error.message
+
+
+def overrides_validate(model):
+    method = getattr(model.validate, '__func__', model.validate)
+    return method is not getattr(Model.validate, '__func__', Model.validate)
+
+
+class FieldRule(object):
+    __slots__ = ('name', 'field', 'required', 'required_message')
+
+    def __init__(self, name, field):
+        self.name = name
+        self.field = field
+        self.required = getattr(field, 'required', False)
+        self.required_message = getattr(field, 'messages', {}).get(
+            'required', REQUIRED_MESSAGE)
+
+
+class FastValidator(object):
+    """
+    Validates a plain dict the way `Model(data).validate(strict=True)`
+    does, field by field, without building the model. Returns the
+    document in the primitive form the model would be saved in.
+
+    `supported` is False for models renaming fields with
+    `serialized_name`/`deserialize_from`, and for models with model level
+    validation (`validate_<field>` methods or own `validate`), they are
+    validated with the model.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.rules = [FieldRule(name, field)
+                      for name, field in model._fields.items()]
+        self.names = frozenset(model._fields)
+        self.supported = not (
+            any(getattr(rule.field, 'serialized_name', None) or
+                getattr(rule.field, 'deserialize_from', None)
+                for rule in self.rules) or
+            getattr(model, '_validator_functions', None) or
+            overrides_validate(model))
+
+    def validate(self, data):
+        """
+        Raises `ModelConversionError` with the same {field: messages}
+        errors as the model.
+        """
+        if not isinstance(data, dict):
+            raise ValueError("Object is expected")
+        errors = {}
+        for name in data:
+            if name not in self.names:
+                errors[name] = ROGUE_MESSAGE
+        result = {}
+        for rule in self.rules:
+            value = data.get(rule.name)
+            if value is None:
+                value = rule.field.default
+            if value is None:
+                if rule.required:
+                    errors[rule.name] = [rule.required_message]
+                result[rule.name] = None
+                continue
+            try:
+                value = rule.field.to_native(value)
+                rule.field.validate(value)
+                result[rule.name] = rule.field.to_primitive(value)
+            except (ConversionError, ValidationError) as e:
+                errors[rule.name] = error_messages(e)
+        if errors:
+            raise ModelConversionError(errors)
+        if result.get('_id') is None:
+            result.pop('_id', None)
+        return result
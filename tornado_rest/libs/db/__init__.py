@@ -1,7 +1,9 @@
 import motor
 import time
 import logging
+from datetime import timedelta
 from pymongo.errors import ConnectionFailure
+from tornado import gen
 from tornado.ioloop import IOLoop
 
 l = logging.getLogger(__name__)
@@ -36,3 +38,114 @@ def connect_mongo(mongo_settings, **kwargs):
             break
     return db
 
+
+@gen.coroutine
+def connect_mongo_async(mongo_settings, **kwargs):
+    """
+    Same as `connect_mongo`, but waits for the connection without blocking
+    the IOLoop and pre-opens `warm_connections` pooled connections.
+    """
+    mongo_addr = kwargs.get('mongo_addr',
+        {'host': mongo_settings['host'], 'port': mongo_settings['port']})
+    mongo_db = kwargs.get('mongo_db', mongo_settings['db_name'])
+    client = None
+    for i in xrange(mongo_settings['reconnect_tries'] + 1):
+        try:
+            client = yield motor.Op(motor.MotorClient(**mongo_addr).open)
+        except ConnectionFailure:
+            if i >= mongo_settings['reconnect_tries']:
+                raise
+            else:
+                timeout = mongo_settings['reconnect_timeout']
+                l.warning("ConnectionFailure #{0} during server start, "
+                    "waiting {1} seconds"
+                    .format(i+1, timeout))
+                yield gen.Task(IOLoop.current().add_timeout,
+                               timedelta(seconds=timeout))
+        else:
+            break
+    db = client[mongo_db]
+    yield warm_pool(db, mongo_settings.get('warm_connections', 0))
+    raise gen.Return(db)
+
+
+@gen.coroutine
+def connect_shards(shard_settings):
+    """
+    Connects to every shard from the `{name: mongo_settings}` dict and
+    registers the databases for models declaring `SHARDS`.
+    """
+    from tornado_rest.base.routing import register_connection
+    names = list(shard_settings)
+    dbs = yield [connect_mongo_async(shard_settings[name]) for name in names]
+    for name, db in zip(names, dbs):
+        register_connection(name, db)
+
+
+@gen.coroutine
+def warm_pool(db, connections):
+    """
+    Runs `connections` concurrent pings, so the pool opens that many
+    sockets before the first request.
+    """
+    if connections:
+        yield [motor.Op(db.command, 'ping') for _ in xrange(connections)]
+
+
+def warm_models(models=None):
+    """
+    Computes lazily built model metadata ahead of the first request.
+    """
+    from tornado_rest.base.models import iter_models
+    for model in models or list(iter_models()):
+        model.references()
+        model.get_read_fields()
+        model.get_indexes()
+        model.get_validator()
+        model.get_record_class()
+
+
+@gen.coroutine
+def startup(app, mongo_settings, models=None, **kwargs):
+    """
+    Connects to mongo and the shards listed in `mongo_settings['shards']`,
+    warms the pool, model metadata and in memory replicas, ensures indexes
+    and then marks the application ready for `ReadinessHandler`.
+
+    Example:
+        app = Application(url_patterns, ready=False)
+        app.listen(8888)
+        IOLoop.instance().add_callback(startup, app, settings.MONGO)
+        IOLoop.instance().start()
+    """
+    app.settings['ready'] = False
+    db = yield connect_mongo_async(mongo_settings, **kwargs)
+    app.settings['db'] = db
+    if mongo_settings.get('shards'):
+        yield connect_shards(mongo_settings['shards'])
+    warm_models(models)
+    yield ensure_indexes(db, models)
+    yield load_replicas(db, models)
+    app.settings['ready'] = True
+    l.info("Application is ready")
+
+
+@gen.coroutine
+def ensure_indexes(db, models=None):
+    """
+    Creates indexes declared with `MONGO_INDEXES` for given models,
+    or for all imported models if none are given.
+    """
+    from tornado_rest.base.models import iter_models
+    for model in models or list(iter_models()):
+        yield model.ensure_indexes(db)
+
+
+@gen.coroutine
+def load_replicas(db, models=None):
+    """
+    Loads collections of models declared with `IN_MEMORY` into memory.
+    """
+    from tornado_rest.base.models import iter_models
+    for model in models or list(iter_models()):
+        yield model.load_replica(db)
@@ -0,0 +1,48 @@
+"""
+Creates indexes declared by models.
+
+Usage:
+    python -m tornado_rest.libs.db.indexes --host=localhost --port=27017 \
+        --db_name=project apps.users.models apps.places.models
+"""
+import sys
+import logging
+from tornado.ioloop import IOLoop
+from tornado.options import options, define, parse_command_line
+
+from . import connect_mongo, ensure_indexes
+
+l = logging.getLogger(__name__)
+
+
+def define_options():
+    define("host", default="localhost", help="mongo host")
+    define("port", default=27017, type=int, help="mongo port")
+    define("db_name", help="mongo database name")
+    try:
+        options.mongodb_reconnect_retries
+    except AttributeError:
+        define("mongodb_reconnect_retries", default=3, type=int)
+        define("mongodb_reconnect_timeout", default=1, type=int)
+
+
+def main(argv=None):
+    define_options()
+    modules = parse_command_line(argv or sys.argv)
+    if not options.db_name:
+        sys.exit("--db_name is required")
+    for module in modules:
+        __import__(module)
+
+    db = connect_mongo({
+        'host': options.host,
+        'port': options.port,
+        'db_name': options.db_name,
+        'reconnect_tries': options.mongodb_reconnect_retries,
+        'reconnect_timeout': options.mongodb_reconnect_timeout,
+    })
+    IOLoop.instance().run_sync(lambda: ensure_indexes(db))
+
+
+if __name__ == "__main__":
+    main()
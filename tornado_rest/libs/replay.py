@@ -0,0 +1,157 @@
+"""
+Replays traffic captured by `TrafficRecorder` against a running instance
+and reports throughput and latency percentiles per route.
+
+Usage:
+    python -m tornado_rest.libs.replay --url=http://localhost:8888 \
+        --rate=200 --concurrency=20 /tmp/traffic.jsonl
+"""
+import sys
+import json
+import time
+import urllib
+import logging
+from datetime import timedelta
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest, HTTPError
+from tornado.options import options, define, parse_command_line
+
+l = logging.getLogger(__name__)
+
+BODY_METHODS = ("POST", "PUT", "PATCH")
+
+
+def define_options():
+    define("url", default="http://localhost:8888", help="base url")
+    define("rate", default=0, type=float,
+           help="requests per second, 0 to send as fast as possible")
+    define("concurrency", default=10, type=int, help="requests in flight")
+    define("timeout", default=20, type=float, help="request timeout")
+    define("repeat", default=1, type=int, help="times to replay the capture")
+
+
+def load(paths):
+    records = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    records.append(json.loads(line))
+    records.sort(key=lambda record: record.get("started", 0))
+    return records
+
+
+def make_request(record, base_url, timeout):
+    url = base_url.rstrip("/") + record["path"]
+    if record.get("arguments"):
+        arguments = dict(
+            (name.encode("utf-8"), [value.encode("utf-8") for value in values])
+            for name, values in record["arguments"].items())
+        url += "?" + urllib.urlencode(arguments, doseq=True)
+    body, headers = None, {}
+    if "body" in record:
+        body = json.dumps(record["body"])
+        headers["Content-Type"] = "application/json"
+    if record["method"] in BODY_METHODS and body is None:
+        body = ""
+    return HTTPRequest(url, method=record["method"], headers=headers,
+                       body=body, request_timeout=timeout)
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    index = int(round(share * (len(values) - 1)))
+    return values[index]
+
+
+class Stats(object):
+    def __init__(self):
+        self.routes = {}
+
+    def add(self, route, status, elapsed):
+        entry = self.routes.setdefault(
+            route, {"latencies": [], "errors": 0, "statuses": {}})
+        entry["latencies"].append(elapsed * 1000)
+        entry["statuses"][status] = entry["statuses"].get(status, 0) + 1
+        if status >= 500:
+            entry["errors"] += 1
+
+    def report(self, elapsed):
+        result = []
+        for route, entry in sorted(self.routes.items()):
+            latencies = sorted(entry["latencies"])
+            result.append({
+                "route": route,
+                "count": len(latencies),
+                "errors": entry["errors"],
+                "statuses": entry["statuses"],
+                "rps": len(latencies) / elapsed if elapsed else None,
+                "p50_ms": percentile(latencies, 0.5),
+                "p90_ms": percentile(latencies, 0.9),
+                "p99_ms": percentile(latencies, 0.99),
+                "max_ms": latencies[-1],
+            })
+        return result
+
+
+@gen.coroutine
+def replay(records, base_url, rate=0, concurrency=10, timeout=20):
+    """
+    Sends the records with at most `concurrency` requests in flight and,
+    if `rate` is given, at most `rate` requests per second. Returns the
+    per route report.
+    """
+    io_loop = IOLoop.current()
+    client = AsyncHTTPClient(max_clients=concurrency)
+    stats = Stats()
+    started = time.time()
+    queue = iter(enumerate(records))
+
+    @gen.coroutine
+    def worker():
+        for number, record in queue:
+            if rate:
+                wait = started + number / rate - time.time()
+                if wait > 0:
+                    yield gen.Task(io_loop.add_timeout,
+                                   timedelta(seconds=wait))
+            request = make_request(record, base_url, timeout)
+            sent = time.time()
+            try:
+                response = yield client.fetch(request)
+                status = response.code
+            except HTTPError as e:
+                status = e.code
+            stats.add(record.get("route") or record["path"], status,
+                      time.time() - sent)
+
+    yield [worker() for _ in xrange(concurrency)]
+    raise gen.Return(stats.report(time.time() - started))
+
+
+def write_report(report, stream=sys.stdout):
+    stream.write("{0:<32} {1:>7} {2:>6} {3:>8} {4:>8} {5:>8} {6:>8}\n".format(
+        "route", "count", "errors", "rps", "p50_ms", "p90_ms", "p99_ms"))
+    for row in report:
+        stream.write(
+            "{route:<32} {count:>7} {errors:>6} {rps:>8.1f} {p50_ms:>8.1f} "
+            "{p90_ms:>8.1f} {p99_ms:>8.1f}\n".format(**row))
+
+
+def main(argv=None):
+    define_options()
+    paths = parse_command_line(argv or sys.argv)
+    if not paths:
+        sys.exit("capture files are required")
+    records = load(paths) * options.repeat
+    l.info("Replaying {0} requests".format(len(records)))
+    report = IOLoop.instance().run_sync(lambda: replay(
+        records, options.url, options.rate, options.concurrency,
+        options.timeout))
+    write_report(report)
+
+
+if __name__ == "__main__":
+    main()